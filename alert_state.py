@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from price_cache import CACHE_DIR, trading_date
+
+
+class AlertStore:
+    """
+    Remembers, per ticker and trading date, that a ticker was flagged, what Gemini decided
+    and whether the email went out, so each ticker is analyzed and emailed at most once a day.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'alerts.sqlite')
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                ticker TEXT NOT NULL,
+                trading_date TEXT NOT NULL,
+                screened_at TEXT NOT NULL,
+                price_data TEXT,
+                is_drop INTEGER,
+                horizon TEXT,
+                why_drop TEXT,
+                notified_at TEXT,
+                PRIMARY KEY (ticker, trading_date)
+            )
+        """)
+
+    def _execute(self, query, params):
+        with self.lock, self.connection:
+            return self.connection.execute(query, params).fetchone()
+
+    def record_screen(self, ticker, price_data):
+        self._execute(
+            """
+            INSERT INTO alerts (ticker, trading_date, screened_at, price_data) VALUES (?, ?, ?, ?)
+            ON CONFLICT (ticker, trading_date) DO UPDATE SET price_data = excluded.price_data
+            """,
+            (ticker, trading_date(), datetime.now().isoformat(), json.dumps(price_data, default=str)),
+        )
+
+    def record_verdict(self, ticker, classification, why_drop):
+        self._execute(
+            "UPDATE alerts SET is_drop = ?, horizon = ?, why_drop = ? WHERE ticker = ? AND trading_date = ?",
+            (int(classification['is_drop']), classification['horizon'], why_drop, ticker, trading_date()),
+        )
+
+    def mark_notified(self, ticker):
+        self._execute(
+            "UPDATE alerts SET notified_at = ? WHERE ticker = ? AND trading_date = ?",
+            (datetime.now().isoformat(), ticker, trading_date()),
+        )
+
+    def is_handled(self, ticker):
+        """
+        True once today's verdict says not to alert, or the alert has already been sent.
+        """
+        row = self._execute(
+            "SELECT is_drop, horizon, notified_at FROM alerts WHERE ticker = ? AND trading_date = ?",
+            (ticker, trading_date()),
+        )
+        if row is None:
+            return False
+        is_drop, horizon, notified_at = row
+        if notified_at is not None:
+            return True
+        return is_drop is not None and (not is_drop or horizon == 'long')
@@ -0,0 +1,214 @@
+import argparse
+import os
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from rich import print
+from screening import slopes, ETF_DIP_THRESHOLD, STOCK_DIP_THRESHOLD, RAPID_GROWTH_MULTIPLIER
+from indicators import bollinger_bands, BOLLINGER_WINDOW, BOLLINGER_WIDTH
+from benchmarks import benchmark_of, with_benchmarks
+from stock_list import MARKET_BENCHMARK
+
+FIXTURE_ARRAYS = ['open', 'high', 'low', 'close']
+# The alert email suggests buying $100 worth per alert (notifications.BUY_AMOUNT_DOLLARS).
+POSITION_SIZE = 100
+
+DEFAULT_PARAMS = {
+    'etf_threshold': ETF_DIP_THRESHOLD,
+    'stock_threshold': STOCK_DIP_THRESHOLD,
+    'rapid_growth_multiplier': RAPID_GROWTH_MULTIPLIER,
+    'slope_months': 24,
+    'require_positive_slope': True,
+    'require_below_band': False,
+    'bollinger_window': BOLLINGER_WINDOW,
+    'bollinger_width': BOLLINGER_WIDTH,
+    # The OCO bracket from order_queue.build_sell_order.
+    'take_profit': .04,
+    'trailing_stop': .03,
+    # The bracket's cancelTime is 60 calendar days, about 41 trading days.
+    'max_hold_days': 41,
+}
+
+
+def export_fixture(directory, symbols, etfs, cache=None):
+    """
+    Writes every stored daily bar for the symbols and their benchmarks as .npy arrays (symbols x days)
+    the backtester can memory map.
+    """
+    from price_cache import PriceCache
+
+    cache = cache or PriceCache()
+    bars = cache.load_bars(with_benchmarks(symbols))
+    os.makedirs(directory, exist_ok=True)
+    close = bars['Close']
+    np.save(os.path.join(directory, 'symbols.npy'), np.array(close.columns, dtype=str))
+    np.save(os.path.join(directory, 'dates.npy'), close.index.to_numpy(dtype='datetime64[D]'))
+    np.save(os.path.join(directory, 'is_etf.npy'), np.isin(close.columns, etfs))
+    for field in FIXTURE_ARRAYS:
+        np.save(os.path.join(directory, f'{field}.npy'), bars[field.capitalize()].T.to_numpy(dtype=float))
+    print(f"Wrote {close.shape[1]} symbols x {close.shape[0]} days to {directory}.")
+
+
+def load_fixture(directory, mmap=True):
+    """
+    Loads a fixture written by export_fixture. Price arrays are memory mapped unless mmap is False.
+    """
+    data = {
+        'symbols': np.load(os.path.join(directory, 'symbols.npy')),
+        'dates': np.load(os.path.join(directory, 'dates.npy')),
+        'is_etf': np.load(os.path.join(directory, 'is_etf.npy')),
+    }
+    for field in FIXTURE_ARRAYS:
+        data[field] = np.load(os.path.join(directory, f'{field}.npy'), mmap_mode='r' if mmap else None)
+    return data
+
+
+def trailing_slopes(close, dates, months):
+    """
+    For every symbol and day, the slope of the monthly closes over the `months` full months before that day.
+
+    This is what get_slope's history(period='2y', interval='1mo') saw, minus the current partial month.
+    Like the live screen, a day with fewer full months behind it is fit over the ones it has, so the slope
+    rule applies from the third month of the fixture on rather than only after `months` months.
+    """
+    month_id = dates.astype('datetime64[M]').astype(int)
+    month_ends = np.flatnonzero(np.diff(month_id, append=month_id[-1] + 1))
+    monthly = close[:, month_ends]
+    n_symbols, n_days = close.shape
+    by_day = np.full((n_symbols, n_days), np.nan)
+    # Left padding gives every month a window ending on it; slopes() fits whatever closes a window holds.
+    padded = np.concatenate([np.full((n_symbols, months - 1), np.nan), monthly], axis=1)
+    windows = sliding_window_view(padded, months, axis=1)
+    window_slopes = slopes(windows.reshape(-1, months)).reshape(n_symbols, -1)
+    # Window w ends on month w, so a day in month m uses window m - 1.
+    window_index = np.searchsorted(month_ends, np.arange(n_days)) - 1
+    has_window = window_index >= 0
+    by_day[:, has_window] = window_slopes[:, window_index[has_window]]
+    return by_day
+
+
+def cached_trailing_slopes(data, months):
+    """
+    trailing_slopes, computed once per window length for a loaded fixture and reused by later runs.
+    """
+    cache = data.setdefault('trailing_slopes', {})
+    if months not in cache:
+        cache[months] = trailing_slopes(np.asarray(data['close']), data['dates'], months)
+    return cache[months]
+
+
+def benchmark_rows(data):
+    """
+    The row of every symbol's own benchmark, or of MARKET_BENCHMARK if the fixture doesn't hold it.
+    """
+    if 'benchmark_rows' not in data:
+        rows = {symbol: row for row, symbol in enumerate(data['symbols'])}
+        market = rows[MARKET_BENCHMARK]
+        data['benchmark_rows'] = np.array([rows.get(benchmark_of(symbol), market) for symbol in data['symbols']])
+    return data['benchmark_rows']
+
+
+def entry_signals(data, params):
+    """
+    The alert() rules for every symbol on every day, checked against that day's close.
+
+    Returns a boolean (symbols x days) array; day 0 is always False since it has no previous day.
+    """
+    open_, high, low, close = (np.asarray(data[field]) for field in FIXTURE_ARRAYS)
+    market = np.flatnonzero(data['symbols'] == MARKET_BENCHMARK)[0]
+
+    price = close[:, 1:]
+    # Each symbol is measured against its own benchmark's move, falling back to the market's on days
+    # the benchmark has no bar, as benchmarks.market_changes does.
+    changes = (close[:, 1:] - open_[:, 1:]) / open_[:, 1:]
+    market_change = changes[benchmark_rows(data)]
+    market_change = np.where(np.isnan(market_change), changes[market][None, :], market_change)
+    threshold = np.where(data['is_etf'][:, None], params['etf_threshold'], params['stock_threshold'])
+    threshold_with_mkt_chng = threshold + (-1.0 * market_change)
+    max_comparable_price = np.maximum.reduce([open_[:, 1:], close[:, :-1], high[:, 1:]])
+    dipped = max_comparable_price * (1 - threshold_with_mkt_chng) > price
+    rapid_growth = low[:, :-1] * params['rapid_growth_multiplier'] < price
+    signals = dipped & ~rapid_growth
+    if params['require_positive_slope']:
+        slope = cached_trailing_slopes(data, params['slope_months'])[:, 1:]
+        signals &= ~(slope < 0)
+    if params['require_below_band']:
+        lower = bollinger_bands(close, params['bollinger_window'], params['bollinger_width'])[2][:, 1:]
+        signals &= price < lower
+
+    entries = np.zeros(close.shape, dtype=bool)
+    entries[:, 1:] = signals
+    return entries
+
+
+def simulate_exits(data, entry_symbols, entry_days, params):
+    """
+    Runs every entry through the OCO bracket at once: a take-profit limit and a trailing stop off the
+    highest high since entry. If both would trigger on the same day the stop is assumed to fill first.
+    Trades still open after max_hold_days (or at the end of the data) are closed at that day's close.
+    """
+    open_, high, low, close = (np.asarray(data[field]) for field in FIXTURE_ARRAYS)
+    last_day = close.shape[1] - 1
+    entry_price = close[entry_symbols, entry_days]
+    target = entry_price * (1 + params['take_profit'])
+    peak = entry_price.copy()
+    exit_price = np.full(entry_price.shape, np.nan)
+    exit_days = np.minimum(entry_days + params['max_hold_days'], last_day)
+    still_open = np.ones(entry_price.shape, dtype=bool)
+
+    for held in range(1, params['max_hold_days'] + 1):
+        day = entry_days + held
+        in_range = still_open & (day <= last_day)
+        if not in_range.any():
+            break
+        day = np.minimum(day, last_day)
+        day_open, day_high, day_low = open_[entry_symbols, day], high[entry_symbols, day], low[entry_symbols, day]
+        stop = peak * (1 - params['trailing_stop'])
+        stopped = in_range & (day_low <= stop)
+        took_profit = in_range & ~stopped & (day_high >= target)
+        exit_price[stopped] = np.minimum(day_open, stop)[stopped]
+        exit_price[took_profit] = np.maximum(day_open, target)[took_profit]
+        closed = stopped | took_profit
+        exit_days[closed] = day[closed]
+        still_open &= ~closed
+        peak = np.where(in_range & ~closed, np.fmax(peak, day_high), peak)
+
+    exit_price[still_open] = close[entry_symbols, exit_days][still_open]
+    return exit_price, exit_days
+
+
+def run_backtest(data, params=None):
+    """
+    Replays the dip strategy over the fixture and returns its P&L, hit rate and max drawdown.
+
+    Every alert buys POSITION_SIZE dollars at that day's close, so a ticker can hold overlapping trades.
+    """
+    params = DEFAULT_PARAMS | (params or {})
+    entry_symbols, entry_days = np.nonzero(entry_signals(data, params))
+    exit_price, exit_days = simulate_exits(data, entry_symbols, entry_days, params)
+    entry_price = np.asarray(data['close'])[entry_symbols, entry_days]
+    returns = exit_price / entry_price - 1
+    completed = np.isfinite(returns)
+    returns, exit_days = returns[completed], exit_days[completed]
+    pnl = returns * POSITION_SIZE
+
+    equity = np.cumsum(pnl[np.argsort(exit_days, kind='stable')])
+    peaks = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:]
+    return {
+        'trades': int(len(returns)),
+        'pnl': float(pnl.sum()),
+        'mean_return': float(returns.mean()) if len(returns) else 0.0,
+        'hit_rate': float((returns > 0).mean()) if len(returns) else 0.0,
+        'max_drawdown': float((peaks - equity).max()) if len(returns) else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest the dip strategy over a local bar fixture.')
+    parser.add_argument('fixture', help='Directory holding the .npy fixture.')
+    parser.add_argument('--export', action='store_true', help='Write the fixture from the local price cache first.')
+    args = parser.parse_args()
+    if args.export:
+        from main import SAFE_STOCK_LIST
+        from stock_list import TOP_ETFS
+        export_fixture(args.fixture, SAFE_STOCK_LIST, TOP_ETFS)
+    print(run_backtest(load_fixture(args.fixture)))
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from stock_list import SECTOR_BENCHMARKS, MARKET_BENCHMARK
+
+BETA_WINDOW = 60
+# Scale each benchmark's move by the ticker's beta to it, instead of assuming a beta of 1.
+USE_BETA = False
+
+
+def benchmark_of(symbol):
+    return SECTOR_BENCHMARKS.get(symbol, MARKET_BENCHMARK)
+
+
+def with_benchmarks(symbols):
+    """
+    The symbols plus every benchmark they need, so both come down in the same fetch.
+    """
+    needed = {benchmark_of(symbol) for symbol in symbols} | {MARKET_BENCHMARK}
+    return list(symbols) + sorted(needed - set(symbols))
+
+
+def rolling_betas(close, window=BETA_WINDOW):
+    """
+    Each symbol's beta to its benchmark over the last `window` daily returns, from a wide (days x symbols) close frame.
+    """
+    returns = close.pct_change(fill_method=None).iloc[-window:]
+    benchmarks = [benchmark_of(symbol) for symbol in close.columns]
+    available = [benchmark in returns.columns for benchmark in benchmarks]
+    benchmark_returns = returns.reindex(columns=benchmarks)
+    benchmark_returns.columns = close.columns
+    both = returns.notna() & benchmark_returns.notna()
+    stock, benchmark = returns.where(both), benchmark_returns.where(both)
+    covariance = ((stock - stock.mean()) * (benchmark - benchmark.mean())).mean()
+    variance = ((benchmark - benchmark.mean()) ** 2).mean()
+    betas = covariance / variance.replace(0, np.nan)
+    return betas.where(available)
+
+
+def market_changes(universe, use_beta=USE_BETA):
+    """
+    The intraday change of every ticker's own benchmark, to use in place of VOO's change.
+
+    Tickers whose benchmark could not be fetched fall back to MARKET_BENCHMARK.
+    """
+    change = (universe['current_price'] - universe['price_at_open']) / universe['price_at_open']
+    benchmarks = universe.index.map(benchmark_of)
+    benchmark_change = pd.Series(change.reindex(benchmarks).to_numpy(), index=universe.index)
+    benchmark_change = benchmark_change.fillna(change.get(MARKET_BENCHMARK, np.nan))
+    if use_beta and 'beta' in universe:
+        benchmark_change = benchmark_change * universe['beta'].fillna(1.0)
+    return benchmark_change
@@ -0,0 +1,77 @@
+import argparse
+
+# Every command imports what it needs when it runs, so `reconcile-orders` doesn't load yfinance,
+# pandas or google.genai and `screen` doesn't load google.genai. Check with `python -X importtime cli.py ...`.
+
+
+def screen(args):
+    """
+    Screens the universe and lists the tickers that dipped, without asking Gemini or sending email.
+    """
+    from rich import print
+    from main import screen
+
+    flagged = [ticker for ticker, data in screen()]
+    print(f"Flagged {len(flagged)} tickers: {', '.join(flagged) if flagged else 'none'}")
+
+
+def analyze(args):
+    """
+    The full hourly run: screen, research every dip with Gemini and email the ones worth buying.
+    """
+    from main import main
+
+    main()
+
+
+def reconcile_orders(args):
+    """
+    Makes sure every position has its take-profit / trailing-stop sell order.
+    """
+    from trader import main
+
+    main(dry_run=args.dry_run)
+
+
+def monitor(args):
+    """
+    Streams quotes all day and alerts as soon as a ticker dips.
+    """
+    from monitor import Monitor
+
+    Monitor().run()
+
+
+def backtest(args):
+    from rich import print
+    from backtest import export_fixture, load_fixture, run_backtest
+
+    if args.export:
+        from main import SAFE_STOCK_LIST
+        from stock_list import TOP_ETFS
+        export_fixture(args.fixture, SAFE_STOCK_LIST, TOP_ETFS)
+    print(run_backtest(load_fixture(args.fixture)))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='buy-the-dip', description='Buy-the-dip screening, alerts and order upkeep.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('screen', help=screen.__doc__.strip()).set_defaults(run=screen)
+    commands.add_parser('analyze', help=analyze.__doc__.strip()).set_defaults(run=analyze)
+    reconcile_parser = commands.add_parser('reconcile-orders', help=reconcile_orders.__doc__.strip())
+    reconcile_parser.add_argument('--dry-run', action='store_true',
+                                  help='Send the orders to a simulated broker instead of Schwab.')
+    reconcile_parser.set_defaults(run=reconcile_orders)
+    commands.add_parser('monitor', help=monitor.__doc__.strip()).set_defaults(run=monitor)
+
+    backtest_parser = commands.add_parser('backtest', help='Backtest the dip strategy over a local bar fixture.')
+    backtest_parser.add_argument('fixture', help='Directory holding the .npy fixture.')
+    backtest_parser.add_argument('--export', action='store_true', help='Write the fixture from the local price cache first.')
+    backtest_parser.set_defaults(run=backtest)
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    args.run(args)
@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from rich import print
+from metrics import span, increment
+
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 4.0
+MIN_REQUESTS_PER_SECOND = 0.5
+MAX_ATTEMPTS = 4
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+
+def is_rate_limited(error):
+    return type(error).__name__ == 'YFRateLimitError' or 'Too Many Requests' in str(error)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. acquire() blocks until a request may be sent.
+
+    The rate adapts to the provider: it is halved whenever a request gets throttled and
+    creeps back up towards the configured rate with every success.
+    """
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(MIN_REQUESTS_PER_SECOND, self.rate / 2)
+            self.tokens = 0
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class FetchReport:
+    """
+    What happened to every symbol a FetchPool was asked for.
+    """
+    def __init__(self):
+        self.succeeded = []
+        self.failed = {}
+        self.retries = 0
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+
+    def print_summary(self):
+        print(f"Fetched {len(self.succeeded)} symbols with {self.retries} retries "
+              f"({self.rate_limited} rate limited).")
+        for symbol, error in self.failed.items():
+            print(f"Skipped {symbol}: {error}")
+
+    def add_succeeded(self, symbols):
+        with self.lock:
+            self.succeeded.extend(symbols)
+
+
+class FetchPool:
+    """
+    Runs per-symbol fetches on a bounded thread pool behind a shared token bucket.
+
+    Failed fetches are retried with jittered exponential backoff until the symbol's retry
+    budget runs out, after which the symbol is recorded in the report and skipped rather
+    than aborting the run.
+    """
+    def __init__(self, max_workers=None, rate=None, max_attempts=None):
+        self.max_workers = max_workers or MAX_WORKERS
+        self.bucket = TokenBucket(rate or REQUESTS_PER_SECOND)
+        self.max_attempts = max_attempts or MAX_ATTEMPTS
+        self.report = FetchReport()
+
+    def call(self, symbol, fetch, name='fetch', record=True):
+        """
+        Runs fetch(symbol) with retries. Returns its result, or None once the retry budget is spent.
+
+        A fetch may return None to signal that the symbol came back empty; that is retried too.
+        Every attempt is timed as a `name` span. With record=False the outcome is left out of the
+        report, for callers that fetch batches and report the symbols in them themselves.
+        """
+        error = None
+        for attempt in range(self.max_attempts):
+            if attempt > 0:
+                with self.report.lock:
+                    self.report.retries += 1
+                increment(f"{name}.retries")
+                backoff = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt)
+                time.sleep(random.uniform(0, backoff))
+            self.bucket.acquire()
+            try:
+                with span(name):
+                    result = fetch(symbol)
+            except Exception as e:
+                error = e
+                if is_rate_limited(e):
+                    self.bucket.throttled()
+                    with self.report.lock:
+                        self.report.rate_limited += 1
+                    increment(f"{name}.rate_limited")
+                continue
+            if result is None:
+                error = 'no data returned'
+                continue
+            self.bucket.succeeded()
+            if record:
+                self.report.add_succeeded([symbol])
+            return result
+        if record:
+            with self.report.lock:
+                self.report.failed[symbol] = str(error)
+        increment(f"{name}.failed")
+        return None
+
+    def map(self, fetch, symbols, name='fetch', record=True):
+        """
+        Fetches every symbol concurrently. Returns {symbol: result} for the ones that succeeded.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda symbol: (symbol, self.call(symbol, fetch, name, record)), symbols)
+            return {symbol: result for symbol, result in results if result is not None}
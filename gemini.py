@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from rich import print
+from price_cache import CACHE_DIR, trading_date
+from metrics import span, increment
+
+# google.genai is imported where it is first needed: it is the slowest import in the project, and
+# screening-only runs and cache hits never touch it.
+MODEL = "gemini-2.5-flash"
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the one genai.Client shared by every call in this process.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google import genai
+            _client = genai.Client()
+        return _client
+
+
+class ResponseCache:
+    """
+    Gemini responses keyed by a hash of the model, prompt and trading date, so reruns on the same day are free.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'gemini.sqlite')
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                trading_date TEXT NOT NULL,
+                text TEXT NOT NULL
+            )
+        """)
+
+    @staticmethod
+    def key(query, config_name):
+        return hashlib.sha256(f"{MODEL}\n{config_name}\n{trading_date()}\n{query}".encode()).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, text):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, trading_date, text) VALUES (?, ?, ?)",
+                (key, trading_date(), text),
+            )
+
+
+class StageStats:
+    """
+    Calls, cache hits, tokens and latency per analysis stage.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def record(self, stage, seconds=0.0, usage=None, cache_hit=False):
+        with self.lock:
+            stats = self.stages.setdefault(stage, {
+                'calls': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'output_tokens': 0, 'seconds': 0.0,
+            })
+            if cache_hit:
+                stats['cache_hits'] += 1
+                return
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            if usage is not None:
+                stats['prompt_tokens'] += usage.prompt_token_count or 0
+                stats['output_tokens'] += usage.candidates_token_count or 0
+
+    def print_summary(self):
+        for stage, stats in self.stages.items():
+            average = stats['seconds'] / stats['calls'] if stats['calls'] else 0.0
+            print(f"{stage}: {stats['calls']} calls ({stats['cache_hits']} cached), "
+                  f"{stats['prompt_tokens']} prompt / {stats['output_tokens']} output tokens, "
+                  f"{average:.1f}s average")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+stats = StageStats()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def search_config():
+    from google.genai import types
+    grounding_tool = types.Tool(
+        google_search=types.GoogleSearch()
+    )
+    return types.GenerateContentConfig(
+        tools=[grounding_tool]
+    )
+
+
+def json_config(schema):
+    from google.genai import types
+    return types.GenerateContentConfig(
+        response_mime_type='application/json',
+        response_schema=schema,
+    )
+
+
+def call_gemini(query, stage='gemini', schema=None):
+    """
+    Asks Gemini with Google Search grounding, or for JSON matching schema when one is given.
+
+    Search grounding can't be combined with JSON mode, so schema calls are only meant for
+    reading text Gemini already produced.
+    """
+    if schema is None:
+        config_name, config = 'google_search', search_config()
+    else:
+        config_name, config = f"json:{json.dumps(schema, sort_keys=True)}", json_config(schema)
+    cache = get_cache()
+    key = ResponseCache.key(query, config_name)
+    cached = cache.get(key)
+    if cached is not None:
+        stats.record(stage, cache_hit=True)
+        increment('gemini.cache_hits')
+        return cached
+
+    increment('gemini.cache_misses')
+    started_at = time.monotonic()
+    try:
+        with span(f"gemini.{stage}"):
+            response = get_client().models.generate_content(
+                model=MODEL,
+                contents=query,
+                config=config,
+            )
+    except Exception as e:
+        if getattr(e, 'code', None) == 429:
+            increment('gemini.rate_limited')
+        raise
+    stats.record(stage, time.monotonic() - started_at, response.usage_metadata)
+    if response.usage_metadata is not None:
+        increment('gemini.prompt_tokens', response.usage_metadata.prompt_token_count or 0)
+        increment('gemini.output_tokens', response.usage_metadata.candidates_token_count or 0)
+
+    print(response.text)
+    if response.text is not None:
+        cache.put(key, response.text)
+    return response.text
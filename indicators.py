@@ -0,0 +1,182 @@
+import numpy as np
+
+BOLLINGER_WINDOW = 20
+BOLLINGER_WIDTH = 2.0
+ATR_WINDOW = 14
+SLOPE_WINDOW = 20
+
+
+def _rolling_sum(values, window):
+    """
+    Sum of each trailing window along the last axis; NaN unless all of the window's bars exist.
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    cumulative = np.cumsum(np.where(valid, values, 0.0), axis=-1)
+    counts = np.cumsum(valid, axis=-1)
+    sums = np.full(values.shape, np.nan)
+    if values.shape[-1] < window:
+        return sums
+    sums[..., window - 1] = cumulative[..., window - 1]
+    sums[..., window:] = cumulative[..., window:] - cumulative[..., :-window]
+    window_counts = counts.copy()
+    window_counts[..., window:] = counts[..., window:] - counts[..., :-window]
+    sums[..., :window - 1] = np.nan
+    return np.where(window_counts == window, sums, np.nan)
+
+
+def rolling_mean_std(close, window=BOLLINGER_WINDOW):
+    """
+    Trailing mean and population standard deviation of every row of a (symbols x days) array.
+    """
+    close = np.asarray(close, dtype=float)
+    # Centering on each row's first valid close keeps the running sums small and the variance accurate.
+    first = np.nan_to_num(close[np.arange(close.shape[0]), np.argmax(~np.isnan(close), axis=1)])[:, None]
+    centered = close - first
+    mean = _rolling_sum(centered, window) / window
+    variance = _rolling_sum(centered ** 2, window) / window - mean ** 2
+    return mean + first, np.sqrt(np.maximum(variance, 0.0))
+
+
+def bollinger_bands(close, window=BOLLINGER_WINDOW, width=BOLLINGER_WIDTH):
+    """
+    Returns (middle, upper, lower) Bollinger bands for every symbol and day.
+    """
+    mean, std = rolling_mean_std(close, window)
+    return mean, mean + width * std, mean - width * std
+
+
+def zscore(close, window=BOLLINGER_WINDOW):
+    mean, std = rolling_mean_std(close, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (np.asarray(close, dtype=float) - mean) / std
+
+
+def true_range(high, low, close):
+    high, low, close = (np.asarray(values, dtype=float) for values in (high, low, close))
+    previous_close = np.concatenate([np.full(close.shape[:-1] + (1,), np.nan), close[..., :-1]], axis=-1)
+    ranges = np.stack([high - low, np.abs(high - previous_close), np.abs(low - previous_close)])
+    return np.where(np.isnan(previous_close), high - low, np.nanmax(ranges, axis=0))
+
+
+def atr(high, low, close, window=ATR_WINDOW):
+    """
+    Average true range as a simple moving average of the true range.
+    """
+    return _rolling_sum(true_range(high, low, close), window) / window
+
+
+def regression_slope(close, window=SLOPE_WINDOW):
+    """
+    Least-squares slope (price per bar) of every trailing window, from running sums instead of a fit per window.
+    """
+    close = np.asarray(close, dtype=float)
+    bar = np.arange(close.shape[-1], dtype=float)
+    sum_y = _rolling_sum(close, window)
+    sum_by = _rolling_sum(close * bar, window)
+    # Shift each window's x to 0 .. window - 1, which leaves the slope unchanged.
+    first_bar = bar - (window - 1)
+    sum_xy = sum_by - first_bar * sum_y
+    sum_x = window * (window - 1) / 2
+    sum_xx = (window - 1) * window * (2 * window - 1) / 6
+    return (window * sum_xy - sum_x * sum_y) / (window * sum_xx - sum_x ** 2)
+
+
+def last_valid(values):
+    """
+    Each row's last non-NaN value, or NaN if the row has none.
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    last = values.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return np.where(valid.any(axis=1), values[np.arange(values.shape[0]), last], np.nan)
+
+
+class RollingIndicators:
+    """
+    Bollinger bands, z-score, ATR and regression slope for the whole universe, updated one bar at a time.
+
+    Every indicator keeps running state per symbol (a windowed Welford mean/M2 for the bands, running
+    sums for ATR and the slope) next to a ring buffer of the window, so update() costs O(1) per symbol
+    no matter how long the window is. preview() answers what the bands and slope would be if a bar
+    still in progress closed at a given price, at the same cost and without moving any window.
+    """
+    def __init__(self, high, low, close, window=BOLLINGER_WINDOW, atr_window=ATR_WINDOW, width=BOLLINGER_WIDTH):
+        """
+        Seeds the state from (symbols x days) history holding at least window + 1 bars.
+        """
+        high, low, close = (np.asarray(values, dtype=float) for values in (high, low, close))
+        self.window = window
+        self.atr_window = atr_window
+        self.width = width
+        self.position = 0
+
+        self.closes = close[:, -window:].copy()
+        self.mean = self.closes.mean(axis=1)
+        self.m2 = ((self.closes - self.mean[:, None]) ** 2).sum(axis=1)
+        x = np.arange(window, dtype=float)
+        self.sum_xy = (self.closes * x).sum(axis=1)
+        self.sum_x = x.sum()
+        self.sum_xx = (x * x).sum()
+
+        self.true_ranges = true_range(high, low, close)[:, -atr_window:].copy()
+        self.atr_position = 0
+        self.sum_true_range = self.true_ranges.sum(axis=1)
+        self.previous_close = close[:, -1].copy()
+
+    def _slid(self, close, rows):
+        """
+        The rows' mean, M2 and slope sum once `close` replaces the oldest close in their windows.
+        """
+        oldest = self.closes[rows, self.position]
+        mean = self.mean[rows]
+        # Every close still in the window moves one step left, and the new close lands at x = window - 1.
+        sum_xy = self.sum_xy[rows] - (mean * self.window - oldest) + (self.window - 1) * close
+        new_mean = mean + (close - oldest) / self.window
+        m2 = self.m2[rows] + (close - oldest) * (close - new_mean + oldest - mean)
+        return new_mean, m2, sum_xy
+
+    def update(self, high, low, close):
+        """
+        Slides every window forward by one bar. Takes one value per symbol for each field.
+        """
+        high, low, close = (np.asarray(values, dtype=float) for values in (high, low, close))
+        self.mean, self.m2, self.sum_xy = self._slid(close, slice(None))
+        self.closes[:, self.position] = close
+        self.position = (self.position + 1) % self.window
+
+        new_range = np.fmax(high - low, np.fmax(np.abs(high - self.previous_close), np.abs(low - self.previous_close)))
+        self.sum_true_range += new_range - self.true_ranges[:, self.atr_position]
+        self.true_ranges[:, self.atr_position] = new_range
+        self.atr_position = (self.atr_position + 1) % self.atr_window
+        self.previous_close = close
+
+    def preview(self, close, rows=slice(None)):
+        """
+        Returns (lower band, z-score, slope) for the rows as if the next bar closed at `close`.
+        """
+        close = np.asarray(close, dtype=float)
+        mean, m2, sum_xy = self._slid(close, rows)
+        std = np.sqrt(np.maximum(m2, 0.0) / self.window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zscore = (close - mean) / std
+        slope = (self.window * sum_xy - self.sum_x * mean * self.window) / (self.window * self.sum_xx - self.sum_x ** 2)
+        return mean - self.width * std, zscore, slope
+
+    def std(self):
+        return np.sqrt(np.maximum(self.m2, 0.0) / self.window)
+
+    def bollinger_bands(self):
+        std = self.std()
+        return self.mean, self.mean + self.width * std, self.mean - self.width * std
+
+    def zscore(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self.previous_close - self.mean) / self.std()
+
+    def atr(self):
+        return self.sum_true_range / self.atr_window
+
+    def slope(self):
+        sum_y = self.mean * self.window
+        return (self.window * self.sum_xy - self.sum_x * sum_y) / (self.window * self.sum_xx - self.sum_x ** 2)
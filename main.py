@@ -1,44 +1,37 @@
-import yfinance as yf
 from rich import print
-from google import genai
-from google.genai import types
+import json
 import os
-import requests
-import math
-from stock_list import TOP_ETFS, SP100
-import numpy as np
+from stock_list import TOP_ETFS, SP100, MARKET_BENCHMARK
+import pandas as pd
+from market_data import fetch_universe_data, fetch_name, refresh_daily_bars, build_universe_frame
+from price_cache import PriceCache, trading_date
+from fetch_pool import FetchPool
+from screening import screen_universe, print_skipped
+from benchmarks import with_benchmarks, market_changes, benchmark_of
+import gemini
+from alert_state import AlertStore
+from metrics import metrics
+from notifications import Digest
+from pipeline import Pipeline
+
+MAX_CONCURRENT_ANALYSES = 4
+# Set BUY_THE_DIP_REQUIRE_BELOW_BAND=1 to only alert on dips that also fall under the lower Bollinger band.
+REQUIRE_BELOW_BAND = os.environ.get('BUY_THE_DIP_REQUIRE_BELOW_BAND', '') not in ('', '0')
+# Symbols per fetch batch; screening and Gemini start on the first batch while the rest download.
+FETCH_BATCH_SIZE = 25
+HORIZONS = ['short', 'medium', 'long']
+CLASSIFICATION_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'is_drop': {'type': 'BOOLEAN'},
+        'horizon': {'type': 'STRING', 'enum': HORIZONS},
+        'confidence': {'type': 'NUMBER'},
+    },
+    'required': ['is_drop', 'horizon', 'confidence'],
+}
 
 SAFE_STOCK_LIST = TOP_ETFS + SP100
 
-def fetch_stock_data(ticker_symbol):
-    try:
-        ticker = yf.Ticker(ticker_symbol)
-        name = ticker.info['longName'] if ticker.info.__contains__('longName') else ticker.info['shortName']
-        slope = get_slope(ticker)
-        return {
-            'current_price': ticker.fast_info.last_price,
-            'price_at_open': ticker.fast_info.open,
-            'price_at_close': ticker.fast_info.previous_close,
-            'price_at_high': ticker.fast_info.day_high,
-            'yesterday_low': ticker.history(period='2d').Low.iloc[0],
-            '2y_slope': slope,
-            'is_etf': ticker_symbol in TOP_ETFS,
-            'name': name,
-        }
-    except Exception as e:
-        print(f"An error occurred while fetching data for {ticker_symbol}: {e}")
-        if 'Too Many Requests' in str(e):
-            raise e
-        return None
-
-def get_slope(ticker):
-    ylist = ticker.history(period='2y', interval='1mo').Close
-    xlist = [i for i in range(0, len(ylist))]
-
-    line = np.polyfit(xlist, ylist, deg=1)
-    slope = line[0]
-    return slope
-
 def alert(data, market_change):
     if rapid_growth(data):
         print(f"Skipping {data['name']} because of recent rapid growth")
@@ -66,29 +59,79 @@ def downwards_slope(data):
     return slope < 0
 
 def screen():
-    market = fetch_stock_data('VOO')
-    market_change = (market['current_price'] - market['price_at_open']) / market['price_at_open']
-    for stock in SAFE_STOCK_LIST:
-        data = fetch_stock_data(stock)
-        if alert(data, market_change):
-            yield stock, data
+    cache = PriceCache()
+    pool = FetchPool()
+    # Before the open the newest bar is yesterday's; screening it as today's would re-alert yesterday's dips.
+    universe = fetch_universe_data(with_benchmarks(SAFE_STOCK_LIST), TOP_ETFS, cache, pool, trading_date())
+    pool.report.print_summary()
+    if MARKET_BENCHMARK not in universe.index:
+        print(f"Could not fetch {MARKET_BENCHMARK} to compare against the market, skipping this run.")
+        return
+    yield from screen_frame(universe, SAFE_STOCK_LIST, cache, pool)
+
+def screen_frame(universe, symbols, cache, pool):
+    """
+    Screens the rows of `symbols` in a universe frame that also holds their benchmarks. Yields (stock, data) for every dip.
+    """
+    screened = universe[universe.index.isin(symbols)]
+    decisions = screen_universe(screened, market_changes(universe).loc[screened.index], REQUIRE_BELOW_BAND)
+    print_skipped(decisions)
+    for stock in screened.index[decisions['alert']]:
+        data = screened.loc[stock].to_dict()
+        data['name'] = fetch_name(stock, cache, pool)
+        yield stock, data
 
 def ask_why_drop(ticker_symbol, ticker_name):
     query = (f'Why was there a drop in stock price for {ticker_symbol} in the past day? Please consult financial news '
              f'sources, analyst reports, earnings reports, and SEC filings related to {ticker_name} for today and '
              f'yesterday to figure out why it dropped.')
-    return call_gemini(query)
+    return gemini.call_gemini(query, stage='why_drop')
 
 def ask_if_actually_drop(why_drop):
     query = f"I asked gemini why there was a price drop for the stock and it provided me with the below response. Can you read it, think about the response, and tell me if the response actually thinks there was a drop? Yes means there was a drop. At the end of your response, just say yes or no.  \n\n {why_drop}"
-    is_drop = call_gemini(query)
+    is_drop = gemini.call_gemini(query, stage='is_drop')
     return is_yes_result(is_drop)
 
 def ask_long_term(why_drop):
     query = f"I asked gemini why there was a price drop for the stock and it provided me with the below response. Can you read it, think about the response, and tell me if the reason for the drop is long term, medium or short term? At the end of your response, just say long, medium, or short.  \n\n {why_drop}"
-    is_long_term = call_gemini(query)
+    is_long_term = gemini.call_gemini(query, stage='long_term')
     return is_long_term_result(is_long_term)
 
+def ask_classification(why_drop):
+    """
+    Asks in one JSON request whether there really was a drop and whether its reason is short, medium or long term.
+
+    Falls back to asking ask_if_actually_drop and ask_long_term separately if the response isn't valid JSON.
+    """
+    query = f"I asked gemini why there was a price drop for the stock and it provided me with the below response. Can you read it and think about the response? Set is_drop to true if the response actually thinks there was a drop. Set horizon to whether the reason for the drop is long term, medium or short term. Set confidence to how sure you are, from 0 to 1.  \n\n {why_drop}"
+    classification = parse_classification(gemini.call_gemini(query, stage='classification', schema=CLASSIFICATION_SCHEMA))
+    if classification is not None:
+        return classification
+    print("Could not parse the classification, asking separately instead.")
+    is_drop = ask_if_actually_drop(why_drop)
+    if not is_drop:
+        return {'is_drop': False, 'horizon': None, 'confidence': None}
+    # is_long_term_result only tells long apart from everything else.
+    horizon = 'long' if ask_long_term(why_drop) else 'short'
+    return {'is_drop': True, 'horizon': horizon, 'confidence': None}
+
+def parse_classification(gemini_response):
+    if gemini_response is None:
+        return None
+    text = gemini_response.strip().removeprefix('```json').removeprefix('```').removesuffix('```')
+    try:
+        classification = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if (not isinstance(classification, dict) or not isinstance(classification.get('is_drop'), bool)
+            or classification.get('horizon') not in HORIZONS):
+        return None
+    return {
+        'is_drop': classification['is_drop'],
+        'horizon': classification['horizon'],
+        'confidence': classification.get('confidence'),
+    }
+
 def is_yes_result(gemini_response):
     relevant_response = gemini_response[-4:]
     relevant_response = strip_fluff(relevant_response)
@@ -105,69 +148,88 @@ def strip_fluff(resp):
     resp = resp.strip('.')
     return resp
 
-def call_gemini(query):
-    client = genai.Client()
-    grounding_tool = types.Tool(
-        google_search=types.GoogleSearch()
-    )
-    config = types.GenerateContentConfig(
-        tools=[grounding_tool]
-    )
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=query,
-        config=config,
-    )
-
-    print(response.text)
-    return response.text
-
-def send_notification(ticker, price_data, gemini_resp):
-  	return requests.post(
-  		"https://api.mailgun.net/v3/sandboxae39eddfee26494d9dc97ed6713b531b.mailgun.org/messages",
-  		auth=("api", os.environ['MAILGUN_SEND_KEY']),
-  		data={"from": "Mailgun Sandbox <postmaster@sandboxae39eddfee26494d9dc97ed6713b531b.mailgun.org>",
-			"to": "Himanshu Ojha <himanshuo@gmail.com>",
-  			"subject": f"[Buy-The-Dip] {ticker}",
-  			"text": format_email_contents(ticker, price_data, gemini_resp)})
-
-def change_price_str(current_price, other_price):
-    price_diff_percentage =  (current_price - other_price) / other_price * 100
-    return f"${other_price:.2f} (current price is {price_diff_percentage:.2f}%)"
-
-def format_email_contents(ticker, price_data, gemini_resp):
-    current_price_str = f"${price_data['current_price']:.2f}"
-    price_at_open_str = change_price_str(price_data['current_price'], price_data['price_at_open'])
-    price_at_close_str = change_price_str(price_data['current_price'], price_data['price_at_close'])
-    price_at_high_str = change_price_str(price_data['current_price'], price_data['price_at_high'])
-    buy_amount = math.floor(100/price_data['current_price'])
-    return f"""{ticker} 
-
-Price Details:
-- Current Price: {current_price_str}
-- Price at Open: {price_at_open_str}
-- Previous Close: {price_at_close_str}
-- Day's High: {price_at_high_str}
-
-Buy {buy_amount} shares at {current_price_str}
-
-Gemini Summary:
-{gemini_resp}
-
-Regards,
-Your Buy-The-Dip Bot
-"""
+def analyze(ticker, stock_data, store=None):
+    """
+    Runs the Gemini stages for one flagged ticker. Returns why it dropped, or None if it should not be alerted.
+    """
+    why_drop = ask_why_drop(ticker, stock_data['name'])
+    classification = ask_classification(why_drop)
+    if store is not None:
+        store.record_verdict(ticker, classification, why_drop)
+    if not classification['is_drop'] or classification['horizon'] == 'long':
+        return None
+    return why_drop
+
+def analyze_flagged(ticker, stock_data, store):
+    """
+    Analyzes a flagged ticker unless it was already handled today. Returns why it dropped if it should be emailed.
+    """
+    store.record_screen(ticker, stock_data)
+    if store.is_handled(ticker):
+        print(f"Already handled {ticker} today, skipping.")
+        return None
+    return analyze(ticker, stock_data, store)
+
+def send_digest(digest, store):
+    """
+    Emails the digest and marks its tickers notified. If it can't be sent, they stay unnotified for the next run to retry.
+    """
+    if digest.send():
+        for ticker in digest.tickers():
+            store.mark_notified(ticker)
+
+def build_pipeline(benchmark_bars, cache, pool, store, digest, session_date=None):
+    """
+    fetch -> screen -> analyze, each stage on its own threads behind a bounded queue. Alerts are collected
+    into the digest, which is sent once the pipeline has drained.
+
+    Bars older than session_date are screened as yesterday's, see build_universe_frame.
+
+    Fetching is one stage thread because the FetchPool already spreads each batch over its workers.
+    """
+    def fetch(batch):
+        to_fetch = [symbol for symbol in batch if symbol not in benchmark_bars['Close'].columns]
+        bars = refresh_daily_bars(to_fetch, cache, pool) if to_fetch else pd.DataFrame()
+        yield batch, bars
+
+    def screen_batch(item):
+        batch, bars = item
+        universe = build_universe_frame(pd.concat([benchmark_bars, bars], axis=1).sort_index(axis=1), TOP_ETFS,
+                                        session_date)
+        yield from screen_frame(universe, batch, cache, pool)
+
+    def analyze_stage(item):
+        ticker, stock_data = item
+        why_drop = analyze_flagged(ticker, stock_data, store)
+        if why_drop is not None:
+            digest.add(ticker, stock_data, why_drop)
+
+    return (Pipeline()
+            .stage('fetch', fetch, queue_size=2)
+            .stage('screen', screen_batch, queue_size=2)
+            .stage('analyze', analyze_stage, workers=MAX_CONCURRENT_ANALYSES))
 
 def main():
-    for ticker, stock_data in screen():
-        why_drop = ask_why_drop(ticker, stock_data['name'])
-        is_drop = ask_if_actually_drop(why_drop)
-        if not is_drop:
-            continue
-        is_long_term = ask_long_term(why_drop)
-        if is_long_term:
-            continue
-        print(f"Sending notification for {ticker} {stock_data} {why_drop}")
-        send_notification(ticker, stock_data, why_drop)
+    store = AlertStore()
+    cache = PriceCache()
+    pool = FetchPool()
+    try:
+        # Every batch is screened against the benchmarks' moves, so they come down first.
+        benchmarks = sorted({benchmark_of(symbol) for symbol in SAFE_STOCK_LIST} | {MARKET_BENCHMARK})
+        benchmark_bars = refresh_daily_bars(benchmarks, cache, pool)
+        if benchmark_bars.empty or MARKET_BENCHMARK not in benchmark_bars['Close'].columns:
+            print(f"Could not fetch {MARKET_BENCHMARK} to compare against the market, skipping this run.")
+            return
+        batches = [SAFE_STOCK_LIST[start:start + FETCH_BATCH_SIZE]
+                   for start in range(0, len(SAFE_STOCK_LIST), FETCH_BATCH_SIZE)]
+        digest = Digest()
+        # The AlertStore keys by trading_date(), so before the open yesterday's bar must not count as today's.
+        build_pipeline(benchmark_bars, cache, pool, store, digest, trading_date()).run(batches)
+        pool.report.print_summary()
+        send_digest(digest, store)
+        gemini.stats.print_summary()
+    finally:
+        metrics.write_summary('main')
+
 if __name__ == '__main__':
     main()
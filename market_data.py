@@ -0,0 +1,257 @@
+import logging
+import threading
+import yfinance as yf
+from yfinance.exceptions import YFRateLimitError
+import pandas as pd
+import numpy as np
+from rich import print
+from screening import slopes
+from indicators import bollinger_bands, zscore, atr, regression_slope, last_valid
+from benchmarks import rolling_betas, benchmark_of
+from price_cache import PriceCache, FIELDS
+from fetch_pool import FetchPool, is_rate_limited
+from metrics import increment
+
+# yf.download fans a batch out over its own threads, so one pool slot (and one token) covers a whole batch.
+BATCH_SIZE = 100
+HISTORY_PERIOD = '2y'
+HISTORY_YEARS = 2
+# Calendar days re-fetched before the newest stored bar, so a few settled bars overlap the stored ones.
+OVERLAP_DAYS = 7
+# Relative change in a settled close that means Yahoo re-adjusted the history (a split or a dividend).
+ADJUSTMENT_TOLERANCE = 1e-3
+UNIVERSE_COLUMNS = ['current_price', 'price_at_open', 'price_at_close', 'price_at_high',
+                    'yesterday_low', '2y_slope', 'bollinger_lower', 'zscore', 'atr', 'trend_slope', 'benchmark', 'beta',
+                    'is_etf', 'name']
+
+
+class _DownloadErrors(logging.Handler):
+    """
+    Collects the errors yfinance logs on the calling thread, where yf.download reports its failed symbols.
+    """
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.thread = threading.get_ident()
+        self.messages = []
+
+    def emit(self, record):
+        if record.thread == self.thread:
+            self.messages.append(record.getMessage())
+
+
+def fetch_daily_batch(symbols, period=HISTORY_PERIOD, start=None):
+    """
+    Fetches daily OHLC bars for a batch of symbols in one yf.download, as a wide (field, symbol) frame
+    holding only the symbols that came back, or None if none did.
+
+    yf.download logs per-symbol failures instead of raising. A rate limit among them is raised as
+    YFRateLimitError so the FetchPool slows down before retrying the batch; an otherwise empty batch
+    is returned as None to be retried.
+    """
+    errors = _DownloadErrors()
+    logger = logging.getLogger('yfinance')
+    logger.addHandler(errors)
+    try:
+        bars = yf.download(list(symbols), period=None if start else period, start=start, interval='1d',
+                           group_by='column', auto_adjust=True, progress=False, threads=True)
+    finally:
+        logger.removeHandler(errors)
+    # Older yfinance releases kept the errors in a module-level dict instead.
+    shared_errors = getattr(getattr(yf, 'shared', None), '_ERRORS', {})
+    messages = errors.messages + [str(error) for symbol, error in shared_errors.items() if symbol in symbols]
+    if any(is_rate_limited(message) for message in messages):
+        raise YFRateLimitError()
+    if bars is None or bars.empty:
+        return None
+    if bars.index.tz is not None:
+        bars.index = bars.index.tz_localize(None)
+    returned = bars['Close'].columns[bars['Close'].notna().any()]
+    if len(returned) == 0:
+        return None
+    return bars.loc[:, bars.columns.get_level_values(1).isin(returned)][FIELDS]
+
+
+def fetch_daily_history(symbol, period=HISTORY_PERIOD, start=None):
+    """
+    Fetches daily OHLC bars for one symbol, or None if Yahoo returned nothing.
+
+    Rate limit errors are raised so the FetchPool can back off and retry.
+    """
+    history = yf.Ticker(symbol).history(period=None if start else period, start=start,
+                                        interval='1d', auto_adjust=True)
+    if history.empty:
+        return None
+    history.index = history.index.tz_localize(None)
+    return history[FIELDS]
+
+
+def download_daily_bars(symbols, pool, period=HISTORY_PERIOD, starts=None):
+    """
+    Downloads daily bars for every symbol through the fetch pool.
+
+    starts optionally maps a symbol to the date to fetch from. Symbols sharing a start are
+    downloaded BATCH_SIZE at a time, each batch retried as a whole; only the symbols a batch
+    still left out are then fetched one by one. Returns a wide DataFrame with (field, symbol)
+    columns, e.g. bars['Close']['VOO']. Symbols that still failed after their retries are
+    left out and recorded in pool.report.
+    """
+    starts = starts or {}
+    groups = {}
+    for symbol in symbols:
+        groups.setdefault(starts.get(symbol), []).append(symbol)
+    batches = [(start, tuple(group[offset:offset + BATCH_SIZE]))
+               for start, group in groups.items() for offset in range(0, len(group), BATCH_SIZE)]
+    frames = list(pool.map(lambda batch: fetch_daily_batch(batch[1], period, batch[0]), batches,
+                           name='yfinance.download', record=False).values())
+    returned = {symbol for frame in frames for symbol in frame['Close'].columns}
+    pool.report.add_succeeded(returned)
+
+    missing = [symbol for symbol in symbols if symbol not in returned]
+    if missing:
+        increment('yfinance.download.missing', len(missing))
+    histories = pool.map(lambda symbol: fetch_daily_history(symbol, period, starts.get(symbol)), missing,
+                         name='yfinance.history')
+    if histories:
+        single = pd.concat(histories, axis=1)
+        single.columns = single.columns.swaplevel(0, 1)
+        frames.append(single)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1).sort_index(axis=1)
+
+
+def readjusted_symbols(bars, cache, last_dates):
+    """
+    Returns the symbols whose re-fetched settled closes no longer match the stored ones.
+
+    Bars are auto-adjusted, so after a split or dividend Yahoo rewrites the whole history while the
+    cache still holds the old adjustment; a 10:1 split would otherwise show up as a 90% drop.
+    The newest stored bar may have been stored intraday, so only the bars before it are compared.
+    """
+    symbols = [symbol for symbol in last_dates if symbol in bars['Close'].columns]
+    if not symbols:
+        return []
+    since = min(last_dates[symbol] for symbol in symbols) - pd.Timedelta(days=OVERLAP_DAYS)
+    stored, fetched = cache.load_bars(symbols, since=since)['Close'].align(bars['Close'][symbols], join='inner')
+    last = pd.Series(last_dates)[stored.columns].to_numpy()
+    settled = stored.index.to_numpy()[:, None] < last[None, :]
+    drift = (fetched / stored - 1).abs().where(settled)
+    return list(drift.columns[(drift > ADJUSTMENT_TOLERANCE).any()])
+
+
+def refresh_daily_bars(symbols, cache, pool):
+    """
+    Brings the cached bars up to date and returns the last HISTORY_YEARS of them.
+
+    Symbols the cache has never seen get the full history. Everything else is fetched
+    from OVERLAP_DAYS before its newest stored bar on, so that (possibly intraday) bar is
+    re-downloaded and anything after it is appended. Symbols whose overlapping bars were
+    re-adjusted since they were stored get their full history again. Symbols that could
+    not be refreshed are left out rather than screened on stale prices.
+    """
+    last_dates = cache.last_bar_dates(symbols)
+    increment('price_cache.hits', len(last_dates))
+    increment('price_cache.misses', len(symbols) - len(last_dates))
+    starts = {symbol: (date - pd.Timedelta(days=OVERLAP_DAYS)).strftime('%Y-%m-%d')
+              for symbol, date in last_dates.items()}
+    bars = download_daily_bars(symbols, pool, starts=starts)
+    if bars.empty:
+        return bars
+    readjusted = readjusted_symbols(bars, cache, last_dates)
+    if readjusted:
+        print(f"Re-downloading the history of {', '.join(readjusted)}, which was re-adjusted since it was cached.")
+        increment('price_cache.readjusted', len(readjusted))
+        # Dropped from the cache first, so a failed re-download means a full fetch next run, not stale bars.
+        cache.delete_bars(readjusted)
+        bars = bars.drop(columns=readjusted, level=1)
+        full = download_daily_bars(readjusted, pool)
+        if not full.empty:
+            bars = pd.concat([bars, full], axis=1).sort_index(axis=1)
+    cache.store_bars(bars)
+    refreshed = list(bars['Close'].columns)
+    return cache.load_bars(refreshed, since=pd.Timestamp.now() - pd.DateOffset(years=HISTORY_YEARS))
+
+
+def monthly_closes(daily_close):
+    """
+    Collapses daily closes into one close per month, matching history(interval='1mo').Close.
+    """
+    return daily_close.resample('MS').last()
+
+
+def _nth_last_valid(frame, n):
+    def pick(column):
+        values = column.dropna()
+        return values.iloc[-n] if len(values) >= n else np.nan
+    return frame.apply(pick)
+
+
+def build_universe_frame(bars, etfs, session_date=None):
+    """
+    Turns the wide bar download into one row per symbol with the price fields the alert rules read.
+
+    The newest bar is taken to be today's. Given the session_date, a symbol whose newest bar is older
+    (before the open, or on a weekend) is instead treated as having a flat session so far at its last
+    close, with that bar as yesterday's.
+    """
+    if bars.empty:
+        return pd.DataFrame(columns=UNIVERSE_COLUMNS)
+    close = bars['Close']
+    frame = pd.DataFrame({
+        'current_price': _nth_last_valid(close, 1),
+        'price_at_open': _nth_last_valid(bars['Open'], 1),
+        'price_at_close': _nth_last_valid(close, 2),
+        'price_at_high': _nth_last_valid(bars['High'], 1),
+        'yesterday_low': _nth_last_valid(bars['Low'], 2),
+        '2y_slope': pd.Series(slopes(monthly_closes(close).T), index=close.columns),
+    })
+    if session_date is not None:
+        before_session = close.apply(lambda column: column.last_valid_index()) < pd.Timestamp(session_date)
+        last_close = frame.loc[before_session, 'current_price']
+        frame.loc[before_session, 'yesterday_low'] = _nth_last_valid(bars['Low'], 1)[before_session]
+        for column in ['price_at_close', 'price_at_open', 'price_at_high']:
+            frame.loc[before_session, column] = last_close
+    high, low, closes = (bars[field].T.to_numpy(dtype=float) for field in ['High', 'Low', 'Close'])
+    frame['bollinger_lower'] = last_valid(bollinger_bands(closes)[2])
+    frame['zscore'] = last_valid(zscore(closes))
+    frame['atr'] = last_valid(atr(high, low, closes))
+    frame['trend_slope'] = last_valid(regression_slope(closes))
+    frame['benchmark'] = frame.index.map(benchmark_of)
+    frame['beta'] = rolling_betas(close)
+    frame['is_etf'] = frame.index.isin(etfs)
+    # Names need the slow per-ticker info endpoint, so they are only looked up for flagged tickers.
+    frame['name'] = frame.index
+    missing = frame.index[frame['current_price'].isna()]
+    if len(missing) > 0:
+        print(f"No price data for {', '.join(missing)}, skipping them.")
+    return frame.drop(index=missing)
+
+
+def fetch_universe_data(symbols, etfs, cache=None, pool=None, session_date=None):
+    cache = cache or PriceCache()
+    pool = pool or FetchPool()
+    bars = refresh_daily_bars(symbols, cache, pool)
+    return build_universe_frame(bars, etfs, session_date)
+
+
+def fetch_metadata(ticker_symbol, cache=None):
+    """
+    Returns {'name', 'is_etf'} for the symbol, from the cache while it is fresher than METADATA_TTL.
+    """
+    cache = cache or PriceCache()
+    metadata = cache.get_metadata(ticker_symbol)
+    if metadata is not None:
+        increment('metadata_cache.hits')
+        return metadata
+    increment('metadata_cache.misses')
+    info = yf.Ticker(ticker_symbol).info
+    name = info['longName'] if info.__contains__('longName') else info['shortName']
+    is_etf = info.get('quoteType') == 'ETF'
+    cache.store_metadata(ticker_symbol, name, is_etf)
+    return {'name': name, 'is_etf': is_etf}
+
+
+def fetch_name(ticker_symbol, cache=None, pool=None):
+    pool = pool or FetchPool()
+    metadata = pool.call(ticker_symbol, lambda symbol: fetch_metadata(symbol, cache), name='yfinance.info')
+    return metadata['name'] if metadata is not None else ticker_symbol
@@ -0,0 +1,129 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from rich import print
+from price_cache import CACHE_DIR
+
+# Defaults to metrics.jsonl in CACHE_DIR.
+METRICS_FILE = os.environ.get('BUY_THE_DIP_METRICS_FILE')
+# Keys whose values are never written out or printed, wherever they appear in a payload.
+SECRET_KEYS = {'access_token', 'refresh_token', 'id_token', 'authorization', 'api_key', 'api_secret',
+               'password', 'accountnumber', 'hashvalue', 'account_num_hash'}
+# Environment variables holding credentials; their values are masked in any string.
+SECRET_ENV_VARS = ['SCHWAB_API_KEY', 'SCHWAB_API_SECRET', 'MAILGUN_SEND_KEY', 'GEMINI_API_KEY', 'GOOGLE_API_KEY']
+SECRET_PATTERNS = [
+    re.compile(r'(Bearer|Basic)\s+[A-Za-z0-9._~+/=-]+'),
+    # A SECRET_KEYS field in query strings or JSON text, e.g. access_token=... or "hashValue":"...".
+    re.compile(r'("?(?:' + '|'.join(sorted(SECRET_KEYS)) + r')"?\s*[:=]\s*"?)[^",&\s}]+', re.IGNORECASE),
+]
+REDACTED = '[redacted]'
+
+
+def scrub(value):
+    """
+    Returns a copy of value with credentials masked: secret keys in dicts, bearer/basic auth headers,
+    SECRET_KEYS fields in query strings or JSON text, and the values of SECRET_ENV_VARS.
+    """
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in SECRET_KEYS else scrub(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [scrub(item) for item in value]
+    if not isinstance(value, str):
+        return value
+    for name in SECRET_ENV_VARS:
+        secret = os.environ.get(name)
+        if secret:
+            value = value.replace(secret, REDACTED)
+    value = SECRET_PATTERNS[0].sub(lambda match: f"{match.group(1)} {REDACTED}", value)
+    return SECRET_PATTERNS[1].sub(lambda match: f"{match.group(1)}{REDACTED}", value)
+
+
+def _percentile(sorted_values, share):
+    return sorted_values[min(len(sorted_values) - 1, int(share * len(sorted_values)))]
+
+
+class Metrics:
+    """
+    Timing spans and counters for one run, shared by every thread.
+
+    Spans are aggregated per name (count, errors, total/p50/p95/max seconds) rather than logged one
+    by one, so a 5,000-symbol fetch adds one line to the metrics file, not 5,000.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.run_id = uuid.uuid4().hex[:12]
+            self.started_at = datetime.now()
+            self.durations = {}
+            self.errors = {}
+            self.counters = {}
+
+    @contextmanager
+    def span(self, name):
+        started_at = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - started_at
+            with self.lock:
+                self.durations.setdefault(name, []).append(seconds)
+                if failed:
+                    self.errors[name] = self.errors.get(name, 0) + 1
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self, command=None):
+        with self.lock:
+            spans = {}
+            for name, durations in self.durations.items():
+                ordered = sorted(durations)
+                spans[name] = {
+                    'count': len(ordered),
+                    'errors': self.errors.get(name, 0),
+                    'total_seconds': round(sum(ordered), 4),
+                    'p50_seconds': round(_percentile(ordered, .5), 4),
+                    'p95_seconds': round(_percentile(ordered, .95), 4),
+                    'max_seconds': round(ordered[-1], 4),
+                }
+            return {
+                'run_id': self.run_id,
+                'command': command or os.path.basename(sys.argv[0]),
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'wall_seconds': round((datetime.now() - self.started_at).total_seconds(), 3),
+                'spans': spans,
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def write_summary(self, command=None, path=None):
+        """
+        Appends this run's summary as one scrubbed JSON line to the metrics file and returns it.
+        """
+        path = path or METRICS_FILE or os.path.join(CACHE_DIR, 'metrics.jsonl')
+        summary = scrub(self.summary(command))
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'a') as file:
+                file.write(json.dumps(summary) + '\n')
+        except OSError as e:
+            print(f"Could not write run metrics to {path}: {e}")
+        return summary
+
+
+metrics = Metrics()
+span = metrics.span
+increment = metrics.increment
@@ -0,0 +1,172 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor
+from rich import print
+from fetch_pool import FetchPool
+from main import SAFE_STOCK_LIST, MAX_CONCURRENT_ANALYSES, REQUIRE_BELOW_BAND, analyze_flagged, send_digest
+from benchmarks import with_benchmarks, market_changes, benchmark_of
+from alert_state import AlertStore
+from market_data import fetch_universe_data, fetch_name, refresh_daily_bars, build_universe_frame
+from indicators import RollingIndicators
+from price_cache import PriceCache, trading_date
+from screening import screen_universe
+from metrics import metrics
+from notifications import Digest
+from stock_list import TOP_ETFS, MARKET_BENCHMARK
+
+CHECK_SECONDS = 15
+STREAM_RETRY_SECONDS = 30
+POLL_SECONDS = 120
+
+# Fields of a Yahoo streaming quote and the universe column each one updates.
+QUOTE_FIELDS = {
+    'price': 'current_price',
+    'open_price': 'price_at_open',
+    'previous_close': 'price_at_close',
+    'day_high': 'price_at_high',
+}
+
+
+class Monitor:
+    """
+    Keeps the universe in memory, streams live quotes into it and re-screens only the symbols
+    whose prices moved. Gemini and email only run when a ticker newly crosses its dip threshold, and
+    the crossings found by one check go out as one digest.
+
+    The bars (and with them the 2-year slope and yesterday's low) are loaded once per trading day;
+    if the quote stream is down, prices fall back to being polled from the bar cache. A day is loaded
+    at midnight, before it has a bar of its own, so the newest bar then counts as yesterday's.
+
+    The Bollinger band, z-score and trend slope follow the live price: the load seeds RollingIndicators
+    with the bars before today, and every quote previews them with its price as today's close.
+    """
+    def __init__(self, symbols=SAFE_STOCK_LIST, etfs=TOP_ETFS):
+        self.symbols = symbols
+        self.fetched_symbols = with_benchmarks(symbols)
+        self.benchmarks = {benchmark_of(symbol) for symbol in symbols} | {MARKET_BENCHMARK}
+        self.etfs = etfs
+        self.cache = PriceCache()
+        self.pool = FetchPool()
+        self.store = AlertStore()
+        self.lock = threading.Lock()
+        self.changed = set()
+        self.alerted = set()
+        self.stream = None
+        self.indicators = None
+        self.rows = {}
+        self.polled_at = 0.0
+        self.analyses = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ANALYSES)
+        # Waits for a check's analyses and sends their digest, so check() itself never blocks on Gemini.
+        self.notifier = ThreadPoolExecutor(max_workers=1)
+        self.load_universe()
+
+    def load_universe(self):
+        session_date = trading_date()
+        bars = refresh_daily_bars(self.fetched_symbols, self.cache, self.pool)
+        universe = build_universe_frame(bars, self.etfs, session_date)
+        indicators = None
+        if not universe.empty:
+            settled = bars[bars.index < pd.Timestamp(session_date)]
+            indicators = RollingIndicators(*(settled[field].reindex(columns=universe.index).T.to_numpy(dtype=float)
+                                             for field in ['High', 'Low', 'Close']))
+        with self.lock:
+            self.universe = universe
+            self.indicators = indicators
+            self.rows = {symbol: row for row, symbol in enumerate(universe.index)}
+            self.trading_date = session_date
+            self.changed = set(universe.index)
+            self.alerted = set()
+
+    def on_quote(self, message):
+        symbol = message.get('id')
+        with self.lock:
+            if symbol not in self.universe.index:
+                return
+            for field, column in QUOTE_FIELDS.items():
+                value = message.get(field)
+                if value is not None and value != self.universe.at[symbol, column]:
+                    self.universe.at[symbol, column] = value
+                    self.changed.add(symbol)
+            price = message.get('price')
+            if price is not None and self.indicators is not None:
+                lower, zscore, slope = self.indicators.preview(np.array([price]), [self.rows[symbol]])
+                self.universe.loc[symbol, ['bollinger_lower', 'zscore', 'trend_slope']] = [lower[0], zscore[0], slope[0]]
+
+    def poll(self):
+        universe = fetch_universe_data(self.fetched_symbols, self.etfs, self.cache, self.pool, self.trading_date)
+        for symbol, row in universe.iterrows():
+            self.on_quote({field: row[column] for field, column in QUOTE_FIELDS.items()} | {'id': symbol})
+
+    def check(self):
+        """
+        Re-screens the symbols whose prices changed since the last check and handles new crossings.
+        """
+        with self.lock:
+            # A benchmark's move shifts the threshold of every ticker measured against it, so a
+            # benchmark tick means rechecking everything.
+            changed = set(self.universe.index) if self.changed & self.benchmarks else self.changed
+            changed &= set(self.symbols)
+            self.changed = set()
+            if not changed or MARKET_BENCHMARK not in self.universe.index:
+                return
+            subset = self.universe.loc[sorted(changed)].copy()
+            market_change = market_changes(self.universe).loc[subset.index]
+        decisions = screen_universe(subset, market_change, REQUIRE_BELOW_BAND)
+        crossed = set(decisions.index[decisions['alert']])
+        new_crossings = crossed - self.alerted
+        self.alerted = (self.alerted - set(decisions.index)) | crossed
+        flagged = []
+        for ticker in sorted(new_crossings):
+            data = subset.loc[ticker].to_dict()
+            data['name'] = fetch_name(ticker, self.cache, self.pool)
+            flagged.append((ticker, data, self.analyses.submit(analyze_flagged, ticker, data, self.store)))
+        if flagged:
+            self.notifier.submit(self.notify, flagged)
+
+    def notify(self, flagged):
+        """
+        Emails the tickers of one check that are worth buying as one digest, once all of them are analyzed.
+        """
+        digest = Digest()
+        for ticker, data, analysis in flagged:
+            try:
+                why_drop = analysis.result()
+            except Exception as e:
+                print(f"Analyzing {ticker} failed: {e!r}")
+                continue
+            if why_drop is not None:
+                digest.add(ticker, data, why_drop)
+        send_digest(digest, self.store)
+
+    def listen(self):
+        while True:
+            try:
+                with yf.WebSocket(verbose=False) as stream:
+                    self.stream = stream
+                    stream.subscribe(list(self.universe.index))
+                    stream.listen(self.on_quote)
+            except Exception as e:
+                print(f"Quote stream stopped: {e}")
+            self.stream = None
+            time.sleep(STREAM_RETRY_SECONDS)
+
+    def run(self):
+        threading.Thread(target=self.listen, daemon=True).start()
+        while True:
+            time.sleep(CHECK_SECONDS)
+            if trading_date() != self.trading_date:
+                # One metrics line per trading day the monitor ran through.
+                metrics.write_summary('monitor')
+                metrics.reset()
+                self.load_universe()
+            elif self.stream is None and time.monotonic() - self.polled_at > POLL_SECONDS:
+                self.polled_at = time.monotonic()
+                self.poll()
+            self.check()
+
+
+if __name__ == '__main__':
+    Monitor().run()
@@ -0,0 +1,204 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import requests
+from rich import print
+from metrics import span, increment
+from price_cache import CACHE_DIR
+
+# Point this at a local stand-in (python notifications.py [--port N]) to test without sending real email.
+MAILGUN_URL = os.environ.get(
+    'BUY_THE_DIP_MAILGUN_URL',
+    "https://api.mailgun.net/v3/sandboxae39eddfee26494d9dc97ed6713b531b.mailgun.org/messages",
+)
+# host:port of an SMTP server to send through instead of Mailgun, e.g. `python -m aiosmtpd -n` on localhost:8025.
+SMTP_SERVER = os.environ.get('BUY_THE_DIP_SMTP_SERVER')
+MAIL_FROM = "Mailgun Sandbox <postmaster@sandboxae39eddfee26494d9dc97ed6713b531b.mailgun.org>"
+MAIL_TO = "Himanshu Ojha <himanshuo@gmail.com>"
+# (connect, read) seconds for the one send of a run.
+SEND_TIMEOUT = (5, 30)
+MAX_SEND_ATTEMPTS = 3
+BASE_BACKOFF_SECONDS = 2.0
+# Tickers named in the subject before it switches to "and N more".
+SUBJECT_TICKERS = 5
+BUY_AMOUNT_DOLLARS = 100
+# Not 8025, which the SMTP stand-in above listens on.
+STAND_IN_PORT = 8026
+
+TICKER_SECTION = """{ticker}
+
+Price Details:
+- Current Price: {current_price}
+- Price at Open: {price_at_open}
+- Previous Close: {price_at_close}
+- Day's High: {price_at_high}
+
+Buy {buy_amount} shares at {current_price}
+
+Gemini Summary:
+{why_drop}
+"""
+DIGEST_BODY = """{count} dip{plural} worth a look:
+
+{sections}
+Regards,
+Your Buy-The-Dip Bot
+"""
+SECTION_SEPARATOR = "\n----------------------------------------\n\n"
+
+
+def change_price_str(current_price, other_price):
+    price_diff_percentage = (current_price - other_price) / other_price * 100
+    return f"${other_price:.2f} (current price is {price_diff_percentage:.2f}%)"
+
+
+def format_ticker_section(ticker, price_data, why_drop):
+    current_price = price_data['current_price']
+    return TICKER_SECTION.format(
+        ticker=ticker,
+        current_price=f"${current_price:.2f}",
+        price_at_open=change_price_str(current_price, price_data['price_at_open']),
+        price_at_close=change_price_str(current_price, price_data['price_at_close']),
+        price_at_high=change_price_str(current_price, price_data['price_at_high']),
+        buy_amount=math.floor(BUY_AMOUNT_DOLLARS / current_price),
+        why_drop=why_drop,
+    )
+
+
+def send_mailgun(subject, text):
+    response = requests.post(
+        MAILGUN_URL,
+        auth=("api", os.environ.get('MAILGUN_SEND_KEY', '')),
+        data={"from": MAIL_FROM, "to": MAIL_TO, "subject": subject, "text": text},
+        timeout=SEND_TIMEOUT,
+    )
+    response.raise_for_status()
+
+
+def send_smtp(subject, text):
+    import smtplib
+
+    message = EmailMessage()
+    message['From'], message['To'], message['Subject'] = MAIL_FROM, MAIL_TO, subject
+    message.set_content(text)
+    host, port = SMTP_SERVER.rsplit(':', 1)
+    with smtplib.SMTP(host, int(port), timeout=SEND_TIMEOUT[1]) as smtp:
+        smtp.send_message(message)
+
+
+def send_email(subject, text):
+    if SMTP_SERVER:
+        send_smtp(subject, text)
+    else:
+        send_mailgun(subject, text)
+
+
+def _is_permanent(error):
+    # A 4xx other than 429 (bad key, bad address) fails the same way on every retry.
+    response = getattr(error, 'response', None)
+    return response is not None and 400 <= response.status_code < 500 and response.status_code != 429
+
+
+class Digest:
+    """
+    Every alert of a run, sent as one email once the run is over.
+
+    Each ticker's section is rendered when it is added, so sending costs one request however many
+    tickers fired.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sections = {}
+
+    def add(self, ticker, price_data, why_drop):
+        section = format_ticker_section(ticker, price_data, why_drop)
+        with self.lock:
+            self.sections[ticker] = section
+
+    def tickers(self):
+        with self.lock:
+            return list(self.sections)
+
+    def subject(self):
+        tickers = self.tickers()
+        named = ', '.join(tickers[:SUBJECT_TICKERS])
+        if len(tickers) > SUBJECT_TICKERS:
+            named += f" and {len(tickers) - SUBJECT_TICKERS} more"
+        return f"[Buy-The-Dip] {named}"
+
+    def text(self):
+        with self.lock:
+            sections = list(self.sections.values())
+        return DIGEST_BODY.format(count=len(sections), plural='' if len(sections) == 1 else 's',
+                                  sections=SECTION_SEPARATOR.join(sections))
+
+    def send(self):
+        """
+        Sends the digest, retrying transient failures with jittered backoff. Returns True once it went out.
+
+        An empty digest sends nothing.
+        """
+        tickers = self.tickers()
+        if not tickers:
+            return False
+        subject, text = self.subject(), self.text()
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            if attempt > 0:
+                increment('notify.retries')
+                time.sleep(random.uniform(0, BASE_BACKOFF_SECONDS * 2 ** attempt))
+            try:
+                with span('notify.send'):
+                    send_email(subject, text)
+            except Exception as e:
+                print(f"Sending the digest failed: {e}")
+                if _is_permanent(e):
+                    break
+                continue
+            print(f"Sent a digest of {len(tickers)} alerts: {', '.join(tickers)}")
+            increment('notify.alerts', len(tickers))
+            return True
+        increment('notify.failed')
+        return False
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Accepts Mailgun message POSTs and writes each one to the outbox directory instead of sending it.
+    """
+    outbox = os.path.join(CACHE_DIR, 'outbox')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        fields = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        os.makedirs(self.outbox, exist_ok=True)
+        message_id = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        with open(os.path.join(self.outbox, f"{message_id}.txt"), 'w') as file:
+            file.write(f"From: {fields.get('from')}\nTo: {fields.get('to')}\nSubject: {fields.get('subject')}\n\n")
+            file.write(fields.get('text', ''))
+        print(f"Received {fields.get('subject')!r}, saved as {message_id}.txt")
+        body = json.dumps({'id': f"<{message_id}@stand-in>", 'message': 'Queued. Thank you.'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the Mailgun messages API.')
+    parser.add_argument('--port', type=int, default=STAND_IN_PORT)
+    args = parser.parse_args()
+    print(f"Saving messages to {StandInHandler.outbox}. "
+          f"Send to it with BUY_THE_DIP_MAILGUN_URL=http://localhost:{args.port}/messages")
+    ThreadingHTTPServer(('localhost', args.port), StandInHandler).serve_forever()
@@ -0,0 +1,367 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from rich import print
+from fetch_pool import TokenBucket
+from metrics import span, increment
+from price_cache import CACHE_DIR, trading_date
+
+# Schwab allows 120 order requests a minute per account; stay under it with room for order syncs.
+ORDERS_PER_SECOND = 1.5
+MAX_ORDER_WORKERS = 4
+MAX_ORDER_ATTEMPTS = 3
+BASE_BACKOFF_SECONDS = 1.0
+ORDER_CANCEL_DAYS = 60
+TRAILING_STOP_PERCENT = 3
+# How far before an order's first attempt to look when asking the broker whether it landed.
+FIND_ORDER_SLACK = timedelta(minutes=1)
+
+
+class OrderRejected(Exception):
+    """
+    The broker refused the order itself (bad symbol, not enough buying power, ...), so retrying won't help.
+    """
+
+
+def _cancel_time():
+    return (datetime.now() + timedelta(days=ORDER_CANCEL_DAYS)).isoformat(timespec='milliseconds') + 'Z'
+
+
+def _equity_leg(instruction, ticker, quantity):
+    return {
+        "orderLegType": "EQUITY",
+        "instruction": instruction,
+        "quantity": quantity,
+        "quantityType": "SHARES",
+        "instrument": {
+            "symbol": ticker.upper(),
+            "assetType": "EQUITY"
+        },
+        "positionEffect": "AUTOMATIC",
+        "legId": "1"
+    }
+
+
+def build_buy_order(ticker, quantity, limit_price):
+    """
+    The payload of a good-till-cancel BUY LIMIT order.
+    """
+    return {
+        "session": "NORMAL",
+        "duration": "GOOD_TILL_CANCEL",
+        "orderType": "LIMIT",
+        "cancelTime": _cancel_time(),
+        "complexOrderStrategyType": "NONE",
+        "quantity": quantity,
+        "price": limit_price,
+        "activationPrice": 0,
+        "orderStrategyType": "SINGLE",
+        "orderLegCollection": [_equity_leg("BUY", ticker, quantity)]
+    }
+
+
+def build_sell_order(ticker, quantity, limit_price):
+    """
+    The payload of a SELL OCO order: a LIMIT at limit_price to take the win, and a TRAILING_STOP
+    TRAILING_STOP_PERCENT under the last price to protect it. Whichever fills first cancels the other.
+    """
+    cancel_time = _cancel_time()
+    return {
+        "orderStrategyType": 'OCO',
+        "childOrderStrategies": [
+            {
+                "session": "NORMAL",
+                "duration": "GOOD_TILL_CANCEL",
+                "cancelTime": cancel_time,
+                "price": limit_price,
+                "orderType": "LIMIT",
+                "orderStrategyType": "SINGLE",
+                "orderLegCollection": [_equity_leg("SELL", ticker, quantity)]
+            },
+            {
+                "session": "NORMAL",
+                "duration": "GOOD_TILL_CANCEL",
+                "cancelTime": cancel_time,
+                "stopPriceLinkType": "PERCENT",
+                "orderType": "TRAILING_STOP",
+                "stopPriceLinkBasis": "LAST",
+                "stopPriceOffset": TRAILING_STOP_PERCENT,
+                "orderStrategyType": "SINGLE",
+                "orderLegCollection": [_equity_leg("SELL", ticker, quantity)]
+            },
+        ],
+    }
+
+
+def order_signature(order):
+    """
+    What makes two orders the same order: the instruction, symbol, quantity, type and price of every leg.
+
+    Works both on payloads built here and on the orders Schwab returns, which carry extra fields and a
+    different cancelTime.
+    """
+    entries = []
+    for strategy in [order] + order.get('childOrderStrategies', []):
+        for leg in strategy.get('orderLegCollection', []):
+            entries.append((
+                leg['instruction'],
+                leg['instrument']['symbol'],
+                float(leg['quantity']),
+                strategy.get('orderType', ''),
+                float(strategy.get('price') or strategy.get('stopPriceOffset') or 0),
+            ))
+    return tuple(sorted(entries))
+
+
+def same_order(order, other):
+    return order_signature(order) == order_signature(other)
+
+
+def idempotency_key(order):
+    """
+    One key per distinct order per trading day, so rerunning the trader the same day can't place it twice.
+    """
+    return hashlib.sha256(json.dumps([trading_date(), order_signature(order)]).encode()).hexdigest()[:32]
+
+
+class OrderLedger:
+    """
+    Every order submission by idempotency key: when it was first tried, and whether it was placed.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'orders.sqlite')
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS submissions (
+                key TEXT PRIMARY KEY,
+                symbol TEXT NOT NULL,
+                first_attempt_at TEXT NOT NULL,
+                status TEXT NOT NULL,
+                order_id INTEGER,
+                error TEXT
+            )
+        """)
+
+    def _execute(self, query, params):
+        with self.lock, self.connection:
+            return self.connection.execute(query, params).fetchone()
+
+    def get(self, key):
+        row = self._execute(
+            "SELECT status, order_id, first_attempt_at FROM submissions WHERE key = ?", (key,)
+        )
+        if row is None:
+            return None
+        return {'status': row[0], 'order_id': row[1], 'first_attempt_at': datetime.fromisoformat(row[2])}
+
+    def begin(self, key, symbol):
+        """
+        Marks the key as in flight, keeping the time of its very first attempt.
+        """
+        self._execute(
+            """
+            INSERT INTO submissions (key, symbol, first_attempt_at, status) VALUES (?, ?, ?, 'pending')
+            ON CONFLICT (key) DO UPDATE SET status = 'pending', error = NULL
+            """,
+            (key, symbol, datetime.now(timezone.utc).isoformat()),
+        )
+
+    def finish(self, key, status, order_id=None, error=None):
+        self._execute(
+            "UPDATE submissions SET status = ?, order_id = ?, error = ? WHERE key = ?",
+            (status, order_id, error, key),
+        )
+
+
+class OrderQueue:
+    """
+    Collects orders and then submits them together: concurrently, under a shared rate cap, each under an
+    idempotency key.
+
+    Schwab has no idempotency header, so the key is enforced on our side through the OrderLedger. An order
+    whose key was already placed is not sent again. After an attempt whose outcome is unknown (a timeout, a
+    5xx, a dropped connection), and for a key an earlier run left pending or failed, the broker is asked
+    whether the order landed before it is sent again.
+
+    The broker is anything with submit_order(payload) -> order id and find_order(payload, since) -> order
+    id or None: a SchwabClient, or a SimulatedBroker for dry runs.
+    """
+    def __init__(self, broker, ledger=None, max_workers=None, rate=None, max_attempts=None):
+        self.broker = broker
+        self.ledger = ledger or OrderLedger()
+        self.max_workers = max_workers or MAX_ORDER_WORKERS
+        self.bucket = TokenBucket(rate or ORDERS_PER_SECOND)
+        self.max_attempts = max_attempts or MAX_ORDER_ATTEMPTS
+        self.orders = []
+
+    def add(self, order):
+        """
+        Queues an order payload. The same order queued twice is only submitted once.
+        """
+        key = idempotency_key(order)
+        if any(queued['key'] == key for queued in self.orders):
+            return key
+        legs = order_signature(order)
+        self.orders.append({'key': key, 'symbol': legs[0][1], 'instruction': legs[0][0], 'order': order})
+        return key
+
+    def add_buy(self, ticker, quantity, limit_price):
+        if quantity == 0:
+            print(f"Skipping BUY for {ticker} because quantity is 0.")
+            return None
+        return self.add(build_buy_order(ticker, quantity, limit_price))
+
+    def add_sell(self, ticker, quantity, limit_price):
+        if quantity == 0:
+            print(f"Skipping SELL for {ticker} because quantity is 0.")
+            return None
+        return self.add(build_sell_order(ticker, quantity, limit_price))
+
+    def submit(self):
+        """
+        Submits everything queued so far. Returns one result dict per order, in the order they were queued:
+        key, symbol, instruction, status ('placed', 'duplicate', 'rejected' or 'failed'), order_id, attempts
+        and error.
+        """
+        orders, self.orders = self.orders, []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self._submit_one, orders))
+
+    def _submit_one(self, queued):
+        key, order = queued['key'], queued['order']
+        result = {'key': key, 'symbol': queued['symbol'], 'instruction': queued['instruction'],
+                  'status': None, 'order_id': None, 'attempts': 0, 'error': None}
+        previous = self.ledger.get(key)
+        if previous is not None and previous['status'] == 'placed':
+            increment('orders.duplicate')
+            return result | {'status': 'duplicate', 'order_id': previous['order_id']}
+        self.ledger.begin(key, queued['symbol'])
+        first_attempt_at = self.ledger.get(key)['first_attempt_at']
+        # An earlier run that left the key pending or failed may have placed the order after all.
+        outcome_unknown = previous is not None and previous['status'] != 'rejected'
+
+        for attempt in range(self.max_attempts + 1):
+            if outcome_unknown:
+                order_id = self.broker.find_order(order, first_attempt_at - FIND_ORDER_SLACK)
+                if order_id is not None:
+                    increment('orders.recovered')
+                    return self._finish(result, 'placed', order_id)
+            if attempt == self.max_attempts:
+                break
+            if attempt > 0:
+                increment('orders.retries')
+                time.sleep(random.uniform(0, BASE_BACKOFF_SECONDS * 2 ** attempt))
+            self.bucket.acquire()
+            result['attempts'] += 1
+            try:
+                with span('orders.submit'):
+                    order_id = self.broker.submit_order(order)
+            except OrderRejected as e:
+                return self._finish(result, 'rejected', error=str(e))
+            except Exception as e:
+                result['error'] = str(e)
+                outcome_unknown = True
+                continue
+            return self._finish(result, 'placed', order_id)
+        return self._finish(result, 'failed', error=result['error'])
+
+    def _finish(self, result, status, order_id=None, error=None):
+        self.ledger.finish(result['key'], status, order_id, error)
+        increment(f"orders.{status}")
+        return result | {'status': status, 'order_id': order_id, 'error': error}
+
+
+def print_results(results):
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    summary = ', '.join(f"{count} {status}" for status, count in counts.items())
+    print(f"Submitted {len(results)} orders: {summary or 'nothing to do'}.")
+    for result in results:
+        if result['status'] in ('rejected', 'failed'):
+            print(f"{result['instruction']} {result['symbol']} {result['status']}: {result['error']}")
+
+
+class SimulatedBroker:
+    """
+    An in-memory stand-in for SchwabClient's order endpoints, for dry runs and offline load tests.
+
+    Every request takes `latency` seconds. reject_rate of the orders are refused outright, and failure_rate
+    of the requests time out: half of those before the order was accepted and half after, like a response
+    lost on its way back, which is the case idempotency keys are for.
+    """
+    def __init__(self, latency=0.0, failure_rate=0.0, reject_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.reject_rate = reject_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.requests = 0
+
+    def submit_order(self, order):
+        time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            roll = self.random.random()
+            if roll < self.reject_rate:
+                raise OrderRejected('simulated rejection')
+            roll -= self.reject_rate
+            if roll < self.failure_rate / 2:
+                raise TimeoutError('simulated timeout before the order was accepted')
+            order_id = len(self.orders) + 1
+            self.orders[order_id] = order | {
+                'orderId': order_id, 'status': 'WORKING', 'enteredTime': datetime.now(timezone.utc),
+            }
+            if roll < self.failure_rate:
+                raise TimeoutError('simulated timeout after the order was accepted')
+        return order_id
+
+    def find_order(self, order, since):
+        time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            for order_id, placed in self.orders.items():
+                if placed['enteredTime'] >= since and same_order(placed, order):
+                    return order_id
+        return None
+
+    def duplicates(self):
+        """
+        How many orders were placed more than once.
+        """
+        signatures = [order_signature(order) for order in self.orders.values()]
+        return len(signatures) - len(set(signatures))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test the order queue against the simulated broker.')
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds per simulated broker request.')
+    parser.add_argument('--failure-rate', type=float, default=0.1)
+    parser.add_argument('--reject-rate', type=float, default=0.02)
+    parser.add_argument('--rate', type=float, default=ORDERS_PER_SECOND, help='Order requests per second.')
+    parser.add_argument('--workers', type=int, default=MAX_ORDER_WORKERS)
+    args = parser.parse_args()
+
+    BASE_BACKOFF_SECONDS = 0.05
+    broker = SimulatedBroker(args.latency, args.failure_rate, args.reject_rate, seed=0)
+    queue = OrderQueue(broker, OrderLedger(':memory:'), max_workers=args.workers, rate=args.rate)
+    for number in range(args.orders):
+        queue.add_sell(f"SIM{number:04d}", 1 + number % 10, round(50 + number * 0.01, 2))
+    started_at = time.perf_counter()
+    results = queue.submit()
+    seconds = time.perf_counter() - started_at
+    print_results(results)
+    print(f"{args.orders / seconds:.1f} orders/s over {broker.requests} broker requests, "
+          f"{broker.duplicates()} duplicate orders at the broker.")
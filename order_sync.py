@@ -0,0 +1,129 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from rich import print
+from price_cache import CACHE_DIR
+
+# An order leaves the book only once it reaches one of these; QUEUED, ACCEPTED, AWAITING_* and the
+# like can still go on to become WORKING.
+TERMINAL_STATUSES = {'FILLED', 'CANCELED', 'REJECTED', 'EXPIRED', 'REPLACED'}
+# Where the very first sync starts looking, before any high-water mark exists.
+FIRST_SYNC_FROM = datetime(2025, 7, 1, tzinfo=timezone.utc)
+# Re-read a little before the high-water mark so orders entered during the last sync aren't missed.
+HIGH_WATER_MARK_OVERLAP = timedelta(minutes=5)
+MAX_ORDER_RESULTS = 3000
+# Schwab only answers order queries entered within the last 60 days.
+MAX_SYNC_AGE = timedelta(days=60)
+
+
+def format_time(time):
+    return time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + f'{time.microsecond // 1000:03d}Z'
+
+
+def _parse_entered_time(entered_time):
+    return datetime.strptime(entered_time.replace(' ', ''), '%Y-%m-%dT%H:%M:%S%z')
+
+
+def order_legs(order):
+    """
+    Every leg of an order, whether it is a SINGLE order or a strategy (OCO, TRIGGER) with child orders.
+    """
+    legs = list(order.get('orderLegCollection', []))
+    for child in order.get('childOrderStrategies', []):
+        legs.extend(order_legs(child))
+    return legs
+
+
+class OrderBook:
+    """
+    A local copy of the account's open orders, kept up to date incrementally.
+
+    Each sync only asks Schwab for orders entered since the last sync's high-water mark,
+    or since the oldest order that was still open, whichever is earlier, so its cost follows
+    the number of recent orders rather than the age of the account. Open orders are also
+    indexed by symbol.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'orders.json')
+        self.path = path
+        self.high_water_mark = FIRST_SYNC_FROM
+        self.open_orders = {}
+        self.by_symbol = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return None
+        self.high_water_mark = datetime.fromisoformat(state['high_water_mark'])
+        self.open_orders = {int(order_id): order for order_id, order in state['open_orders'].items()}
+        self._index()
+        return None
+
+    def _save(self):
+        with open(self.path, 'w') as file:
+            json.dump({
+                'high_water_mark': self.high_water_mark.isoformat(),
+                'open_orders': self.open_orders,
+            }, file)
+
+    def _index(self):
+        self.by_symbol = {}
+        for order in self.open_orders.values():
+            for symbol in {leg['instrument']['symbol'] for leg in order_legs(order)}:
+                self.by_symbol.setdefault(symbol, []).append(order)
+
+    def sync_from(self):
+        """
+        Where the next sync starts: the high-water mark, or the oldest open order if that is earlier,
+        since a status change doesn't move an order's enteredTime.
+
+        The take-profit / trailing-stop sells stay open for weeks, so in practice this is the age of
+        the oldest unfilled sell, bounded at MAX_SYNC_AGE. Open orders older than that (the sells'
+        cancelTime is as long as the window) are re-read one by one in sync().
+        """
+        oldest_open = [_parse_entered_time(order['enteredTime']) for order in self.open_orders.values()]
+        sync_from = min([self.high_water_mark - HIGH_WATER_MARK_OVERLAP] + oldest_open)
+        return max(sync_from, datetime.now(timezone.utc) - MAX_SYNC_AGE)
+
+    def sync(self, client):
+        """
+        Fetches the orders entered since sync_from() and merges them in, all statuses in one pass.
+
+        Open orders entered before sync_from() can't be part of that query, so each is re-read by id.
+        """
+        synced_at = datetime.now(timezone.utc)
+        sync_from = self.sync_from()
+        orders = self._fetch(client, sync_from, synced_at + timedelta(hours=24))
+        orders += [client.get_order(order_id) for order_id, order in self.open_orders.items()
+                   if _parse_entered_time(order['enteredTime']) < sync_from]
+        for order in orders:
+            if order['status'] in TERMINAL_STATUSES:
+                self.open_orders.pop(order['orderId'], None)
+            else:
+                self.open_orders[order['orderId']] = order
+        self.high_water_mark = synced_at
+        self._index()
+        self._save()
+        print(f"Synced {len(orders)} orders, {len(self.open_orders)} open.")
+        return self
+
+    def _fetch(self, client, from_time, to_time):
+        # Schwab caps a response at MAX_ORDER_RESULTS orders and has no page cursor, so a full
+        # page is split into two halves by entered time until every page fits.
+        orders = client.get_orders(format_time(from_time), format_time(to_time), MAX_ORDER_RESULTS)
+        if len(orders) < MAX_ORDER_RESULTS or to_time - from_time < timedelta(minutes=1):
+            return orders
+        middle = from_time + (to_time - from_time) / 2
+        return self._fetch(client, from_time, middle) + self._fetch(client, middle, to_time)
+
+    def has_open_sell_order(self, symbol):
+        return any(
+            leg['instruction'] == 'SELL' and leg['instrument']['symbol'] == symbol
+            for order in self.by_symbol.get(symbol, [])
+            for leg in order_legs(order)
+        )
@@ -0,0 +1,76 @@
+import queue
+import threading
+from rich import print
+from metrics import span, increment
+
+_DONE = object()
+
+
+class Pipeline:
+    """
+    Stages joined by bounded queues, each stage running on its own threads.
+
+    A stage's work(item) returns an iterable of items for the next stage (a generator, a list, or None
+    for nothing). Every queue holds at most queue_size items, so a slow stage blocks the ones feeding it
+    instead of letting work pile up: with Gemini busy, screening waits on a full analysis queue and
+    fetching waits on screening, rather than flagging tickers faster than Gemini's quota allows.
+    End-to-end time is then set by the slowest stage, with the others overlapping it.
+
+    Each item is timed as a `pipeline.<stage>` span, and the time a stage spends blocked on the next
+    stage's full queue as `pipeline.<stage>.blocked`.
+    """
+    def __init__(self):
+        self.stages = []
+
+    def stage(self, name, work, workers=1, queue_size=None):
+        """
+        Appends a stage. queue_size bounds the queue in front of it and defaults to twice its workers.
+        """
+        self.stages.append({
+            'name': name,
+            'work': work,
+            'workers': workers,
+            'queue': queue.Queue(maxsize=queue_size or 2 * workers),
+        })
+        return self
+
+    def _worker(self, position):
+        stage = self.stages[position]
+        next_queue = self.stages[position + 1]['queue'] if position + 1 < len(self.stages) else None
+        while True:
+            item = stage['queue'].get()
+            if item is _DONE:
+                return
+            try:
+                with span(f"pipeline.{stage['name']}"):
+                    for output in stage['work'](item) or ():
+                        if next_queue is None:
+                            continue
+                        with span(f"pipeline.{stage['name']}.blocked"):
+                            next_queue.put(output)
+            except Exception as e:
+                increment(f"pipeline.{stage['name']}.errors")
+                print(f"Pipeline stage {stage['name']} failed: {e!r}")
+
+    def run(self, items):
+        """
+        Feeds items into the first stage and returns once every stage has drained.
+        """
+        threads = []
+        for position, stage in enumerate(self.stages):
+            threads.append([
+                threading.Thread(target=self._worker, args=(position,), name=f"{stage['name']}-{number}", daemon=True)
+                for number in range(stage['workers'])
+            ])
+        for stage_threads in threads:
+            for thread in stage_threads:
+                thread.start()
+
+        for item in items:
+            self.stages[0]['queue'].put(item)
+        # Stop the stages front to back: a stage is told it is done only after everything upstream of it is.
+        for stage, stage_threads in zip(self.stages, threads):
+            for _ in stage_threads:
+                stage['queue'].put(_DONE)
+            for thread in stage_threads:
+                thread.join()
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+CACHE_DIR = os.environ.get('BUY_THE_DIP_CACHE_DIR', '.cache')
+METADATA_TTL = timedelta(days=7)
+FIELDS = ['Open', 'High', 'Low', 'Close']
+MARKET_TIMEZONE = ZoneInfo('America/New_York')
+# pandas is imported inside the bar methods only, so order syncing and metrics, which just need
+# CACHE_DIR and trading_date(), don't pay for it at startup.
+
+
+def trading_date():
+    return datetime.now(MARKET_TIMEZONE).date().isoformat()
+
+
+class PriceCache:
+    """
+    A local SQLite store of daily bars and ticker metadata, so runs only download what is new.
+
+    One connection is shared by every thread (the pipeline's fetch and screen stages, the monitor's
+    poller), so each use of it holds the lock.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'prices.sqlite')
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS bars (
+                symbol TEXT NOT NULL,
+                date TEXT NOT NULL,
+                open REAL, high REAL, low REAL, close REAL,
+                PRIMARY KEY (symbol, date)
+            );
+            CREATE TABLE IF NOT EXISTS metadata (
+                symbol TEXT PRIMARY KEY,
+                name TEXT,
+                is_etf INTEGER,
+                fetched_at TEXT NOT NULL
+            );
+        """)
+
+    def last_bar_dates(self, symbols):
+        """
+        Returns {symbol: date of the newest stored bar} for the symbols that have any bars.
+        """
+        import pandas as pd
+        placeholders = ','.join('?' * len(symbols))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT symbol, MAX(date) FROM bars WHERE symbol IN ({placeholders}) GROUP BY symbol",
+                list(symbols),
+            ).fetchall()
+        return {symbol: pd.Timestamp(date) for symbol, date in rows}
+
+    def store_bars(self, bars):
+        """
+        Upserts a wide (field, symbol) bar frame, as returned by yf.download.
+        """
+        long = bars[FIELDS].stack(level=1, future_stack=True).dropna(subset=['Close'])
+        dates = long.index.get_level_values(0).strftime('%Y-%m-%d')
+        symbols = long.index.get_level_values(1)
+        rows = list(zip(symbols, dates, *(long[field].tolist() for field in FIELDS)))
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO bars (symbol, date, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_bars(self, symbols):
+        placeholders = ','.join('?' * len(symbols))
+        with self.lock, self.connection:
+            self.connection.execute(f"DELETE FROM bars WHERE symbol IN ({placeholders})", list(symbols))
+
+    def load_bars(self, symbols, since=None):
+        """
+        Reads stored bars back into the same wide (field, symbol) layout yf.download returns.
+        """
+        import pandas as pd
+        placeholders = ','.join('?' * len(symbols))
+        query = f"SELECT symbol, date, open, high, low, close FROM bars WHERE symbol IN ({placeholders})"
+        params = list(symbols)
+        if since is not None:
+            query += " AND date >= ?"
+            params.append(pd.Timestamp(since).strftime('%Y-%m-%d'))
+        with self.lock:
+            long = pd.read_sql_query(query, self.connection, params=params, parse_dates=['date'])
+        long.columns = ['symbol', 'date'] + FIELDS
+        wide = long.pivot(index='date', columns='symbol', values=FIELDS)
+        return wide.sort_index()
+
+    def get_metadata(self, symbol):
+        """
+        Returns the cached {'name', 'is_etf'} for the symbol, or None if it is missing or older than METADATA_TTL.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT name, is_etf, fetched_at FROM metadata WHERE symbol = ?", (symbol,)
+            ).fetchone()
+        if row is None or datetime.now() - datetime.fromisoformat(row[2]) > METADATA_TTL:
+            return None
+        return {'name': row[0], 'is_etf': bool(row[1])}
+
+    def store_metadata(self, symbol, name, is_etf):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata (symbol, name, is_etf, fetched_at) VALUES (?, ?, ?, ?)",
+                (symbol, name, int(is_etf), datetime.now().isoformat()),
+            )
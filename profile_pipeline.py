@@ -0,0 +1,313 @@
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+from rich import print
+from rich.table import Table
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SIZES = [100, 500, 5000]
+HISTORY_DAYS = 520
+# Share of the replayed universe whose last bar is made to dip, so the Gemini and email stages have work to do.
+DIP_SHARE = .05
+
+
+class Recorder:
+    """
+    Wraps functions to count their calls and add up their wall time under a label.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.seconds = {}
+        self.patched = []
+
+    def record(self, label, seconds):
+        with self.lock:
+            self.calls[label] = self.calls.get(label, 0) + 1
+            self.seconds[label] = self.seconds.get(label, 0.0) + seconds
+
+    def wrap(self, owner, name, label):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(label, time.perf_counter() - started_at)
+
+        setattr(owner, name, timed)
+        self.patched.append((owner, name, original))
+
+    def replace(self, owner, name, replacement):
+        self.patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def restore(self):
+        for owner, name, original in reversed(self.patched):
+            setattr(owner, name, original)
+        self.patched = []
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+            self.seconds = {}
+
+
+def replay_histories(symbols):
+    """
+    Deterministic daily bars per symbol, in the shape yf.Ticker.history returns them.
+
+    The last bar is always on today's trading date, weekend or not, so it is screened as a live session.
+    """
+    from price_cache import trading_date
+
+    today = pd.Timestamp(trading_date(), tz='America/New_York')
+    index = pd.bdate_range(end=today - pd.Timedelta(days=1), periods=HISTORY_DAYS - 1, tz='America/New_York')
+    index = index.append(pd.DatetimeIndex([today]))
+    histories = {}
+    for position, symbol in enumerate(symbols):
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.015, HISTORY_DAYS)))
+        open_ = close * (1 + rng.normal(0, 0.005, HISTORY_DAYS))
+        if position % round(1 / DIP_SHARE) == 1:
+            close[-1] = open_[-1] * 0.9
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, HISTORY_DAYS)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, HISTORY_DAYS)))
+        histories[symbol] = pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close}, index=index)
+    return histories
+
+
+class ReplayTicker:
+    histories = {}
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def history(self, period=None, start=None, **kwargs):
+        history = self.histories.get(self.symbol, pd.DataFrame())
+        if start is not None and not history.empty:
+            history = history[history.index >= pd.Timestamp(start, tz=history.index.tz)]
+        return history.copy()
+
+    @property
+    def info(self):
+        return {'longName': f"{self.symbol} Replayed Inc.", 'quoteType': 'EQUITY'}
+
+
+def replay_download(tickers, period=None, start=None, **kwargs):
+    """
+    Stands in for yf.download, answering from ReplayTicker's histories in the (field, symbol) layout.
+    """
+    histories = {symbol: ReplayTicker(symbol).history(period=period, start=start) for symbol in tickers}
+    histories = {symbol: history for symbol, history in histories.items() if not history.empty}
+    if not histories:
+        return pd.DataFrame()
+    bars = pd.concat(histories, axis=1)
+    bars.columns = bars.columns.swaplevel(0, 1)
+    return bars.sort_index(axis=1)
+
+
+class ReplayGemini:
+    """
+    Stands in for genai.Client, answering from fixtures/gemini_responses.json.
+    """
+    def __init__(self, responses):
+        self.responses = responses
+        self.models = self
+
+    def generate_content(self, model, contents, config):
+        class Usage:
+            prompt_token_count = self.responses['prompt_token_count']
+            candidates_token_count = self.responses['candidates_token_count']
+
+        class Response:
+            usage_metadata = Usage()
+            text = (json.dumps(self.responses['classification']) if config.response_schema is not None
+                    else self.responses['why_drop'])
+
+        return Response()
+
+
+class ReplaySchwab:
+    """
+    Stands in for SchwabClient, answering from current_stocks_example.json and current_orders_example.json
+    scaled up to one position per symbol, with an open sell order on every other one.
+    """
+    def __init__(self, symbols, recorder):
+        from order_sync import OrderBook
+
+        with open(os.path.join(REPO_DIR, 'current_stocks_example.json')) as file:
+            account = json.load(file)
+        with open(os.path.join(REPO_DIR, 'current_orders_example.json')) as file:
+            order = json.load(file)[0]
+        template = account['securitiesAccount']['positions'][0]
+        account['securitiesAccount']['positions'] = [
+            template | {'instrument': template['instrument'] | {'symbol': symbol}} for symbol in symbols
+        ]
+        self.account = account
+        self.orders = []
+        entered_time = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S+0000')
+        for order_id, symbol in enumerate(symbols[::2]):
+            legs = [order['orderLegCollection'][0] | {'instrument': {'symbol': symbol}}]
+            self.orders.append(order | {'orderId': order_id, 'enteredTime': entered_time,
+                                        'orderLegCollection': legs})
+        self.order_book = OrderBook
+        self.recorder = recorder
+
+    def view_positions(self):
+        self.recorder.record('schwab.positions', 0.0)
+        return self.account
+
+    def sync_orders(self):
+        return self.order_book().sync(self)
+
+    def get_orders(self, from_entered_time, to_entered_time, max_results):
+        self.recorder.record('schwab.orders', 0.0)
+        return self.orders
+
+    def get_order(self, order_id):
+        self.recorder.record('schwab.order', 0.0)
+        return self.orders[order_id]
+
+    def get_quotes(self, symbols):
+        self.recorder.record('schwab.quotes', 0.0)
+        return {symbol: 100.0 for symbol in symbols}
+
+    def submit_order(self, order):
+        self.recorder.record('schwab.place_order', 0.0)
+        return len(self.orders)
+
+    def find_order(self, order, since):
+        self.recorder.record('schwab.orders', 0.0)
+        return None
+
+
+def universe_of(size):
+    from main import SAFE_STOCK_LIST
+
+    symbols = list(SAFE_STOCK_LIST[:size])
+    symbols += [f"R{number:04d}" for number in range(size - len(symbols))]
+    return symbols
+
+
+def run_stage(recorder, name, stage, track_memory=True):
+    """
+    Times one stage. tracemalloc slows allocation-heavy code down, so wall times are only comparable between
+    runs that were made with the same track_memory setting.
+    """
+    recorder.reset()
+    if track_memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    stage()
+    wall_seconds = time.perf_counter() - started_at
+    peak_bytes = tracemalloc.get_traced_memory()[1] if track_memory else None
+    if track_memory:
+        tracemalloc.stop()
+    return {
+        'stage': name,
+        'wall_seconds': round(wall_seconds, 4),
+        'peak_mb': round(peak_bytes / 2 ** 20, 2) if track_memory else None,
+        'calls': dict(recorder.calls),
+        'seconds': {label: round(seconds, 4) for label, seconds in recorder.seconds.items()},
+    }
+
+
+def profile(size, track_memory=True):
+    """
+    Runs screen(), main() and trader.main() against replayed providers for a universe of `size` symbols.
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ['BUY_THE_DIP_CACHE_DIR'] = cache_dir
+        import alert_state, benchmarks, fetch_pool, gemini, main, market_data, metrics, notifications, order_queue, order_sync, price_cache, trader
+        for module in (price_cache, gemini, alert_state, order_sync, order_queue, metrics):
+            module.CACHE_DIR = cache_dir
+
+        symbols = universe_of(size)
+        with open(os.path.join(FIXTURES_DIR, 'gemini_responses.json')) as file:
+            gemini_responses = json.load(file)
+        ReplayTicker.histories = replay_histories(benchmarks.with_benchmarks(symbols))
+
+        recorder = Recorder()
+        recorder.replace(market_data.yf, 'Ticker', ReplayTicker)
+        recorder.replace(market_data.yf, 'download', replay_download)
+        recorder.replace(fetch_pool, 'REQUESTS_PER_SECOND', 1e9)
+        recorder.replace(order_queue, 'ORDERS_PER_SECOND', 1e9)
+        recorder.replace(main, 'SAFE_STOCK_LIST', symbols)
+        recorder.replace(gemini, '_client', ReplayGemini(gemini_responses))
+        recorder.replace(gemini, '_cache', None)
+        recorder.replace(gemini, 'stats', gemini.StageStats())
+        recorder.replace(notifications, 'send_email', lambda *args: recorder.record('email.send', 0.0))
+        recorder.replace(trader, 'get_client', lambda: ReplaySchwab(symbols, recorder))
+        recorder.wrap(market_data, 'fetch_daily_batch', 'yfinance.download')
+        recorder.wrap(market_data, 'fetch_daily_history', 'yfinance.history')
+        recorder.wrap(market_data, 'fetch_metadata', 'yfinance.info')
+        for owner in (market_data, main):
+            recorder.wrap(owner, 'refresh_daily_bars', 'fetch_bars')
+            recorder.wrap(owner, 'build_universe_frame', 'build_universe_frame')
+        recorder.wrap(main, 'screen_universe', 'screen_rules')
+        recorder.wrap(gemini, 'call_gemini', 'gemini')
+        try:
+            return [
+                run_stage(recorder, 'screen (cold cache)', lambda: list(main.screen()), track_memory),
+                run_stage(recorder, 'main (warm cache)', main.main, track_memory),
+                run_stage(recorder, 'trader.main', trader.main, track_memory),
+            ]
+        finally:
+            recorder.restore()
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_results(results):
+    table = Table(title='buy-the-dip pipeline profile')
+    for column in ['commit', 'size', 'stage', 'wall s', 'peak MB', 'calls']:
+        table.add_column(column)
+    for result in results:
+        calls = ', '.join(f"{label}={count}" for label, count in sorted(result['calls'].items()))
+        peak_mb = '-' if result['peak_mb'] is None else f"{result['peak_mb']:.1f}"
+        table.add_row(str(result['commit']), str(result['size']), result['stage'],
+                      f"{result['wall_seconds']:.3f}", peak_mb, calls)
+    print(table)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile the screen -> analyze -> notify pipeline on replayed fixtures.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--output', default='profile_results.jsonl', help='JSON-lines file the results are appended to.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc, which inflates wall times.')
+    parser.add_argument('--compare', action='store_true', help='Print every run saved in --output instead of profiling.')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.output) as file:
+            print_results([json.loads(line) for line in file])
+        raise SystemExit
+
+    commit = current_commit()
+    run_at = datetime.now().isoformat(timespec='seconds')
+    results = []
+    for size in args.sizes:
+        for result in profile(size, track_memory=not args.no_memory):
+            results.append({'commit': commit, 'run_at': run_at, 'size': size, 'track_memory': not args.no_memory} | result)
+    with open(args.output, 'a') as file:
+        for result in results:
+            file.write(json.dumps(result) + '\n')
+    print_results(results)
@@ -1,10 +1,65 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import webbrowser
 import base64
-import pandas as pd
+import json
+import threading
 from rich import print
-from datetime import datetime, timedelta
+from order_sync import OrderBook, MAX_ORDER_RESULTS, format_time
+from order_queue import OrderRejected, same_order
+from metrics import span, increment, scrub
+from datetime import datetime, timedelta, timezone
+
+# (connect, read) seconds for every Schwab request.
+REQUEST_TIMEOUT = (5, 30)
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+TOKENS_FILE = 'schwab_tokens.json'
+QUOTES_BATCH_SIZE = 200
+# Orders in these states were never (or are no longer) live, so a retry has to place the order again.
+DEAD_STATUSES = {'CANCELED', 'REJECTED', 'EXPIRED'}
+# Refresh the access token when it has less than this left, rather than let a request fail on it.
+TOKEN_EXPIRY_MARGIN = timedelta(minutes=2)
+
+
+def _build_session():
+    """
+    A keep-alive session that retries idempotent requests on 429/5xx with exponential backoff.
+
+    POSTs are never retried automatically, so a flaky connection can't place an order twice.
+    """
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=['GET'],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
+
+def _expires_at(tokens_dict):
+    # Schwab access tokens last 30 minutes.
+    return datetime.now() + timedelta(seconds=tokens_dict.get('expires_in', 1800))
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns one SchwabClient shared by every caller in this process.
+    """
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = SchwabClient()
+        return _shared_client
 
 
 class SchwabClient:
@@ -18,8 +73,55 @@ class SchwabClient:
         self.api_key = os.environ.get('SCHWAB_API_KEY')
         self.api_secret = os.environ.get('SCHWAB_API_SECRET')
         self.access_token = None
-        self._refresh_access_token()
-        self.account_num_hash = self._get_account_num_hash()
+        self.access_token_expires_at = None
+        self.account_num_hash = None
+        self.token_lock = threading.Lock()
+        self.session = _build_session()
+        self._load_tokens()
+        self._ensure_access_token()
+        if self.account_num_hash is None:
+            self.account_num_hash = self._get_account_num_hash()
+            self._save_tokens()
+
+    def _load_tokens(self):
+        """
+        Picks up the access token, its expiry and the account hash saved by an earlier run.
+        """
+        try:
+            with open(TOKENS_FILE, 'r') as file:
+                tokens = json.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"An error occurred while reading {TOKENS_FILE}: {e}")
+            return None
+        self._set_access_token(tokens['access_token'], datetime.fromisoformat(tokens['expires_at']))
+        self.account_num_hash = tokens.get('account_num_hash')
+        return None
+
+    def _save_tokens(self):
+        try:
+            with open(TOKENS_FILE, 'w') as file:
+                json.dump({
+                    'access_token': self.access_token,
+                    'expires_at': self.access_token_expires_at.isoformat(),
+                    'account_num_hash': self.account_num_hash,
+                }, file)
+        except Exception as e:
+            print(f"An error occurred while saving {TOKENS_FILE}: {e}")
+        return None
+
+    def _ensure_access_token(self):
+        """
+        Refreshes the access token only if there is none or it is about to expire.
+        """
+        with self.token_lock:
+            if (self.access_token is not None
+                    and self.access_token_expires_at - datetime.now() > TOKEN_EXPIRY_MARGIN):
+                return None
+            self._refresh_access_token()
+            self._save_tokens()
+        return None
 
     def _refresh_access_token(self):
         refresh_token_value = self._get_saved_refresh_token()
@@ -33,27 +135,28 @@ class SchwabClient:
             "Content-Type": "application/x-www-form-urlencoded",
         }
 
-        refresh_token_response = requests.post(
+        refresh_token_response = self._request(
+            "POST",
             url="https://api.schwabapi.com/v1/oauth/token",
             headers=headers,
             data=payload,
+            authenticated=False,
+            name='oauth_token',
         )
         if refresh_token_response.status_code == 200:
             print("Retrieved new tokens successfully using refresh token.")
         else:
             print(
-                f"Error refreshing access token: {refresh_token_response.text}. Trying oauth from the start."
+                f"Error refreshing access token: {scrub(refresh_token_response.text)}. Trying oauth from the start."
             )
             self._do_oauth_from_start()
             return None
 
         refresh_token_dict = refresh_token_response.json()
 
-        print(refresh_token_dict)
-
         print("Token dict refreshed.")
         self._save_refresh_token(refresh_token_dict["refresh_token"])
-        self.access_token = refresh_token_dict['access_token']
+        self._set_access_token(refresh_token_dict['access_token'], _expires_at(refresh_token_dict))
         return None
 
     def _get_saved_refresh_token(self):
@@ -61,7 +164,7 @@ class SchwabClient:
         try:
             with open(file_path, 'r') as file:
                 content = file.read()
-                print(f"Retrieved refresh token: {content}")
+                print("Retrieved refresh token.")
                 return content
         except FileNotFoundError:
             print(f"Error: The file at {file_path} was not found.")
@@ -81,7 +184,32 @@ class SchwabClient:
     def _do_oauth_from_start(self):
         tokens_dict = self._get_access_token()
         self._save_refresh_token(tokens_dict['refresh_token'])
-        self.access_token = tokens_dict['access_token']
+        self._set_access_token(tokens_dict['access_token'], _expires_at(tokens_dict))
+
+    def _set_access_token(self, access_token, expires_at):
+        self.access_token = access_token
+        self.access_token_expires_at = expires_at
+        self.session.headers['Authorization'] = f"Bearer {access_token}"
+
+    def _request(self, method, url, authenticated=True, name='request', **kwargs):
+        """
+        Sends one request on the shared session, timed as a `schwab.<name>` span.
+
+        Retries the session made on its own and any 429s it saw are added to the run's counters.
+        """
+        if authenticated:
+            self._ensure_access_token()
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        with span(f"schwab.{name}"):
+            response = self.session.request(method, url, **kwargs)
+        retries = getattr(response.raw, 'retries', None)
+        history = retries.history if retries is not None else ()
+        if history:
+            increment('schwab.retries', len(history))
+        rate_limited = sum(attempt.status == 429 for attempt in history) + (response.status_code == 429)
+        if rate_limited:
+            increment('schwab.rate_limited', rate_limited)
+        return response
 
     def _create_auth_request(self, returned_url, app_key, app_secret):
         response_code = f"{returned_url[returned_url.index('code=') + 5: returned_url.index('%40')]}@"
@@ -105,10 +233,13 @@ class SchwabClient:
         return headers, payload
 
     def _retrieve_tokens(self, headers, payload) -> dict:
-        init_token_response = requests.post(
+        init_token_response = self._request(
+            "POST",
             url="https://api.schwabapi.com/v1/oauth/token",
             headers=headers,
             data=payload,
+            authenticated=False,
+            name='oauth_token',
         )
 
         init_tokens_dict = init_token_response.json()
@@ -134,203 +265,120 @@ class SchwabClient:
             headers=init_token_headers, payload=init_token_payload
         )
 
-        print(init_tokens_dict)
+        print(scrub(init_tokens_dict))
 
         return init_tokens_dict
 
     def _get_account_num_hash(self):
-        response = requests.get(
-            "https://api.schwabapi.com/trader/v1/accounts/accountNumbers",
-            headers={"Authorization": f"Bearer {self.access_token}"}
-        )
-        print(response, response.text)
-        response_frame = pd.json_normalize(response.json())
-        print(f"Account Number Hash: {response_frame['hashValue'].iloc[0]}")
-        return response_frame["hashValue"].iloc[0]
+        response = self._request("GET", "https://api.schwabapi.com/trader/v1/accounts/accountNumbers",
+                                 name='account_numbers')
+        response.raise_for_status()
+        accounts = response.json()
+        print(response, scrub(accounts))
+        return accounts[0]["hashValue"]
 
     def view_positions(self):
-        response = requests.get(
-            f"https://api.schwabapi.com/trader/v1/accounts/{self.account_num_hash}?fields=positions",
-            headers={"Authorization": f"Bearer {self.access_token}"}
+        response = self._request(
+            "GET", f"https://api.schwabapi.com/trader/v1/accounts/{self.account_num_hash}?fields=positions",
+            name='positions',
         )
-        print(response, response.text)
-        return response.json()
+        positions = response.json()
+        print(response, scrub(positions))
+        return positions
+
+    def get_quotes(self, symbols):
+        """
+        Fetches the last price of every symbol with Schwab's multi-symbol quotes endpoint.
+
+        Returns {symbol: last price}. Symbols Schwab doesn't know are left out.
+        """
+        prices = {}
+        symbols = list(symbols)
+        for start in range(0, len(symbols), QUOTES_BATCH_SIZE):
+            batch = symbols[start:start + QUOTES_BATCH_SIZE]
+            response = self._request(
+                "GET",
+                "https://api.schwabapi.com/marketdata/v1/quotes",
+                params={"symbols": ",".join(batch), "fields": "quote"},
+                name='quotes',
+            )
+            response.raise_for_status()
+            for symbol, quote in response.json().items():
+                if 'quote' in quote:
+                    prices[symbol] = quote['quote']['lastPrice']
+        return prices
 
     def view_open_orders(self):
-        open_orders = []
-        working_orders = self.make_view_open_orders_request("WORKING")
-        pending_activation_orders = self.make_view_open_orders_request("PENDING_ACTIVATION")
-        open_orders.extend(working_orders)
-        open_orders.extend(pending_activation_orders)
-        return open_orders
-
-    def make_view_open_orders_request(self, status):
-        old_time = "2025-07-01T00:00:00.000Z"
-        new_time_obj = datetime.now() + timedelta(hours=24)
-        new_time = new_time_obj.strftime('%Y-%m-%dT%H:%M:%S') + f'.{new_time_obj.microsecond // 1000:03d}Z'
-        url_prefix = f"https://api.schwabapi.com/trader/v1/accounts/{self.account_num_hash}/orders?fromEnteredTime={old_time}&toEnteredTime={new_time}"
-        headers = {"Authorization": f"Bearer {self.access_token}"}
-
-        response = requests.get(url_prefix + f"&status={status}", headers=headers)
-        print(response, response.text)
-        return response.json()
+        return list(self.sync_orders().open_orders.values())
+
+    def sync_orders(self):
+        """
+        Brings the locally kept OrderBook up to date and returns it.
+        """
+        return OrderBook().sync(self)
 
-    def place_buy_order(self, ticker, quantity, limit_price):
+    def get_orders(self, from_entered_time, to_entered_time, max_results):
         """
-        Places a BUY LIMIT order through the Schwab API.
+        Fetches the account's orders of every status entered in the given window.
+        """
+        response = self._request(
+            "GET",
+            f"https://api.schwabapi.com/trader/v1/accounts/{self.account_num_hash}/orders",
+            params={
+                "fromEnteredTime": from_entered_time,
+                "toEnteredTime": to_entered_time,
+                "maxResults": max_results,
+            },
+            name='orders',
+        )
+        response.raise_for_status()
+        orders = response.json()
+        print(response, scrub(orders))
+        return orders
+
+    def get_order(self, order_id):
+        response = self._request(
+            "GET",
+            f"https://api.schwabapi.com/trader/v1/accounts/{self.account_num_hash}/orders/{order_id}",
+            name='order',
+        )
+        response.raise_for_status()
+        return response.json()
 
-        Args:
-            ticker: The stock symbol to buy.
-            quantity: The number of shares to buy.
-            limit_price: The limit price.
+    def submit_order(self, order):
+        """
+        Sends one order payload and returns the id Schwab gave it.
 
-        Returns:
-            The JSON response from the API.
+        Raises OrderRejected when Schwab refuses the order itself. Any other error leaves it unknown
+        whether the order was placed; find_order can tell.
         """
-        if quantity == 0:
-            print(f"Skipping BUY for {ticker} because quantity is 0.")
-            return
-        endpoint = f"https://api.schwabapi.com/trader/v1/accounts/{self.account_num_hash}/orders"
-        cancel_time = (datetime.now() + timedelta(days=60)).isoformat(timespec='milliseconds') + 'Z'
-
-
-        body_limit_order = {
-            "session": "NORMAL",
-            "duration": "GOOD_TILL_CANCEL",
-            "orderType": "LIMIT",
-            "cancelTime": cancel_time,
-            "complexOrderStrategyType": "NONE",
-            "quantity": quantity,
-            "price": limit_price,
-            "activationPrice": 0,
-            "orderStrategyType": "SINGLE",
-            "orderLegCollection": [
-                {
-                    "orderLegType": "EQUITY",
-                    "instruction": "BUY",
-                    "quantity": quantity,
-                    "quantityType": "SHARES",
-                    "instrument": {
-                        "symbol": ticker.upper(),
-                        "assetType": "EQUITY"
-                    },
-                    "positionEffect": "AUTOMATIC",
-                    "legId": "1"
-                }
-            ]
-        }
-        print(f"POST {endpoint} \n {body_limit_order}")
-        try:
-            response = requests.post(
-                endpoint,
-                headers={
-                    "Authorization": f"Bearer {self.access_token}"
-                },
-                json=body_limit_order)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            print(f"Buy Limit order placed successfully. status code = {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"An error occurred while placing the buy limit order: {e}")
-            if e.response:
-                print(f"Response content: {e.response.text}")
-
-    def place_sell_order(self, ticker, quantity, limit_price):
+        response = self._request(
+            "POST",
+            f"https://api.schwabapi.com/trader/v1/accounts/{self.account_num_hash}/orders",
+            json=order,
+            name='place_order',
+        )
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise OrderRejected(f"{response.status_code}: {scrub(response.text)}")
+        response.raise_for_status()
+        # The new order's URL, ending in its id, comes back in the Location header.
+        location = response.headers.get('Location')
+        return int(location.rstrip('/').rsplit('/', 1)[-1]) if location else None
+
+    def find_order(self, order, since):
         """
-        Places a SELL OCO order through the Schwab API.
-        There are 2 legs to this order - a SELL LIMIT order for the top end,
-        and a SELL STOP TRAILING order for the bottom end.
-        The high price is the SELL LIMIT order - this is used for taking our wins.
-        The low price is the SELL STOP TRAILING order - this is used for ensuring we
-        capture the wins and protect against downside.
-
-        Args:
-            ticker: The stock symbol to buy.
-            quantity: The number of shares to buy.
-            limit_price: The limit price to sell at. This is the high price.
-
-        Returns:
-            The JSON response from the API.
+        Returns the id of a live order entered since `since` with the same legs as `order`, or None.
         """
-        if quantity == 0:
-            print(f"Skipping SELL for {ticker} because quantity is 0.")
-            return
-
-        endpoint = f"https://api.schwabapi.com/trader/v1/accounts/{self.account_num_hash}/orders"
-        cancel_time = (datetime.now() + timedelta(days=60)).isoformat(timespec='milliseconds') + 'Z'
-
-
-        sell_oco_order = {
-            "orderStrategyType": 'OCO',
-            "childOrderStrategies":[
-                {
-                    "session": "NORMAL",
-                    "duration": "GOOD_TILL_CANCEL",
-                    "cancelTime": cancel_time,
-                    "price": limit_price,
-                    "orderType": "LIMIT",
-                    "orderStrategyType": "SINGLE",
-                    "orderLegCollection": [
-                        {
-                            "orderLegType": "EQUITY",
-                            "instruction": "SELL",
-                            "quantity": quantity,
-                            "quantityType": "SHARES",
-                            "instrument": {
-                                "symbol": ticker.upper(),
-                                "assetType": "EQUITY"
-                            },
-                            "positionEffect": "AUTOMATIC",
-                            "legId": "1"
-                        }
-                    ]
-                },
-                {
-                    "session": "NORMAL",
-                    "duration": "GOOD_TILL_CANCEL",
-                    "cancelTime": cancel_time,
-                    "stopPriceLinkType": "PERCENT",
-                    "orderType": "TRAILING_STOP",
-                    "stopPriceLinkBasis": "LAST",
-                    "stopPriceOffset": 3,
-                    "orderStrategyType": "SINGLE",
-                    "orderLegCollection": [
-                        {
-                            "orderLegType": "EQUITY",
-                            "instruction": "SELL",
-                            "quantity": quantity,
-                            "quantityType": "SHARES",
-                            "instrument": {
-                                "symbol": ticker.upper(),
-                                "assetType": "EQUITY"
-                            },
-                            "positionEffect": "AUTOMATIC",
-                            "legId": "1"
-                        }
-                    ]
-                },
-            ],
-        }
-        print(f"POST {endpoint} \n {sell_oco_order}")
-        try:
-            response = requests.post(
-                endpoint,
-                headers={
-                    "Authorization": f"Bearer {self.access_token}"
-                },
-                json=sell_oco_order)
-            print(response.text)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            print(f"Sell OCO order placed successfully. status code = {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"An error occurred while placing the sell oco order: {e}")
-            if e.response:
-                print(f"Response content: {e.response.text}")
+        to_time = datetime.now(timezone.utc) + timedelta(days=1)
+        for placed in self.get_orders(format_time(since), format_time(to_time), MAX_ORDER_RESULTS):
+            if placed.get('status') not in DEAD_STATUSES and same_order(placed, order):
+                return placed['orderId']
+        return None
+
 
 if __name__ == '__main__':
     client = SchwabClient()
     # client.view_positions()
     # client.view_open_orders()
-    # client.place_trade("buy", "IQ", 2, 1.5)
-    # client.place_trade("sell", "IQ", 2, 2.1)
 
 
@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+from rich import print
+
+ETF_DIP_THRESHOLD = .01
+STOCK_DIP_THRESHOLD = .03
+RAPID_GROWTH_MULTIPLIER = 1.07
+
+
+def slopes(price_matrix):
+    """
+    Least-squares slope of every row of a (tickers x bars) price matrix in one pass.
+
+    Missing bars (NaN) are dropped per row before fitting, exactly like np.polyfit over
+    history().Close would see them, so a ticker with a shorter history is fit over the
+    bars it has. Rows with fewer than two bars get NaN.
+    """
+    prices = np.asarray(price_matrix, dtype=float)
+    valid = ~np.isnan(prices)
+    x = np.where(valid, np.cumsum(valid, axis=1) - 1, 0).astype(float)
+    y = np.where(valid, prices, 0.0)
+    n = valid.sum(axis=1)
+    sum_x = x.sum(axis=1)
+    sum_y = y.sum(axis=1)
+    sum_xx = (x * x).sum(axis=1)
+    sum_xy = (x * y).sum(axis=1)
+    denominator = n * sum_xx - sum_x ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * sum_xy - sum_x * sum_y) / denominator
+    return np.where(n >= 2, slope, np.nan)
+
+
+def screen_universe(universe, market_change, require_below_band=False):
+    """
+    Applies the alert() rules to every row of the universe frame at once.
+
+    market_change is either one number for the whole universe or one value per row.
+    Returns a frame with a column per rule and an 'alert' column matching alert().
+    With require_below_band, a dip also has to close under the lower Bollinger band.
+    """
+    current_price = universe['current_price'].to_numpy(dtype=float)
+    is_etf = universe['is_etf'].to_numpy(dtype=bool)
+    market_change = np.broadcast_to(np.asarray(market_change, dtype=float), current_price.shape)
+
+    rapid_growth = universe['yesterday_low'].to_numpy(dtype=float) * RAPID_GROWTH_MULTIPLIER < current_price
+    downwards_slope = universe['2y_slope'].to_numpy(dtype=float) < 0
+
+    threshold = np.where(is_etf, ETF_DIP_THRESHOLD, STOCK_DIP_THRESHOLD)
+    threshold_with_mkt_chng = threshold + (-1.0 * market_change)
+    max_comparable_price = np.maximum.reduce([
+        universe['price_at_open'].to_numpy(dtype=float),
+        universe['price_at_close'].to_numpy(dtype=float),
+        universe['price_at_high'].to_numpy(dtype=float),
+    ])
+    dipped = max_comparable_price * (1 - threshold_with_mkt_chng) > current_price
+
+    alert = dipped & ~rapid_growth & ~downwards_slope
+    if require_below_band:
+        alert &= current_price < universe['bollinger_lower'].to_numpy(dtype=float)
+
+    return pd.DataFrame({
+        'rapid_growth': rapid_growth,
+        'downwards_slope': downwards_slope & ~rapid_growth,
+        'threshold': threshold_with_mkt_chng,
+        'dipped': dipped,
+        'alert': alert,
+    }, index=universe.index)
+
+
+def print_skipped(decisions):
+    rapid_growth = decisions.index[decisions['rapid_growth']]
+    if len(rapid_growth) > 0:
+        print(f"Skipping {', '.join(rapid_growth)} because of recent rapid growth")
+    downwards_slope = decisions.index[decisions['downwards_slope']]
+    if len(downwards_slope) > 0:
+        print(f"Skipping {', '.join(downwards_slope)} because of 2-year downwards slope")
+
+
+def check_against_alert(universe, market_change):
+    """
+    Verifies that screen_universe makes the same decision as main.alert for every ticker.
+    """
+    from main import alert
+
+    decisions = screen_universe(universe, market_change)
+    market_change = np.broadcast_to(np.asarray(market_change, dtype=float), (len(universe),))
+    mismatches = [
+        ticker for (ticker, row), change in zip(universe.iterrows(), market_change)
+        if alert(row.to_dict(), change) != decisions.loc[ticker, 'alert']
+    ]
+    if mismatches:
+        raise AssertionError(f"Vectorized screen disagrees with alert() for {', '.join(mismatches)}")
+    return decisions
+
+
+def synthetic_universe(size=2000, seed=0):
+    """
+    A random universe frame around the rule boundaries: ETFs and stocks, prices a little either side of
+    their dip thresholds, rapid growth, negative slopes, and missing slopes and lows.
+    """
+    rng = np.random.default_rng(seed)
+    price_at_open = rng.uniform(10, 500, size)
+    universe = pd.DataFrame({
+        'current_price': price_at_open * (1 + rng.uniform(-.06, .02, size)),
+        'price_at_open': price_at_open,
+        'price_at_close': price_at_open * (1 + rng.uniform(-.03, .03, size)),
+        'price_at_high': price_at_open * (1 + rng.uniform(0, .03, size)),
+        'yesterday_low': price_at_open * rng.uniform(.9, 1.0, size),
+        '2y_slope': rng.normal(.1, .2, size),
+        'is_etf': rng.random(size) < .3,
+    }, index=[f"T{number:05d}" for number in range(size)])
+    universe['name'] = universe.index
+    universe.loc[rng.random(size) < .05, '2y_slope'] = np.nan
+    universe.loc[rng.random(size) < .05, 'yesterday_low'] = np.nan
+    return universe
+
+
+def check_offline():
+    """
+    Checks screen_universe against alert() on a synthetic universe, with one market change for everything
+    and with one per row, so it runs without network access.
+    """
+    universe = synthetic_universe()
+    check_against_alert(universe, -.004)
+    per_row = np.random.default_rng(1).normal(0, .01, len(universe))
+    decisions = check_against_alert(universe, per_row)
+    return decisions
+
+
+if __name__ == '__main__':
+    import argparse
+    import contextlib
+    import io
+
+    parser = argparse.ArgumentParser(description='Check the vectorized screen against alert().')
+    parser.add_argument('--offline', action='store_true', help='Use a synthetic universe instead of live Yahoo data.')
+    args = parser.parse_args()
+    if args.offline:
+        # alert() prints every skipped ticker.
+        with contextlib.redirect_stdout(io.StringIO()):
+            decisions = check_offline()
+    else:
+        from benchmarks import with_benchmarks, market_changes
+        from main import SAFE_STOCK_LIST
+        from market_data import fetch_universe_data
+        from stock_list import TOP_ETFS
+
+        universe = fetch_universe_data(with_benchmarks(SAFE_STOCK_LIST), TOP_ETFS)
+        decisions = check_against_alert(universe, market_changes(universe))
+    print(f"Vectorized screen matches alert() for all {len(decisions)} tickers.")
@@ -12,4 +12,30 @@ TOP_ETFS = [
     'VCIT','QUAL','SGOV','XLF','VT','SCHF','IAU','TLT','VEU','IXUS','ESPO','VV','IWR','BIL','IWB','JEPI','IVE','MBB',
     'SPYG','DIA','MUB','BSV','VTEB','DFAC','SCHB','IEF','VCSH','VNQ','XLV','IUSB','DGRO','JPST','VGIT','VBR','VONG',
     'JEPQ','MGK','LQD','SMH','XLE','GOVT','TQQQ','SPYV','SPDW','VGK','EFV','USHY','FBTC','SHY','IUSG','XLC','USMV',
-    'BIV','VXF','MDY','JAAA','VGSH','XLI','ACWI','XLY','IYW','GBTC','IGSB','IUSV',]
\ No newline at end of file
+    'BIV','VXF','MDY','JAAA','VGSH','XLI','ACWI','XLY','IYW','GBTC','IGSB','IUSV',]
+
+MARKET_BENCHMARK = 'VOO'
+
+# The sector SPDR each stock is measured against. Anything not listed here is measured against MARKET_BENCHMARK.
+SECTOR_BENCHMARKS = {
+    'NVDA': 'XLK', 'MSFT': 'XLK', 'AAPL': 'XLK', 'AMZN': 'XLY', 'EA': 'XLC', 'AUR': 'XLI', 'AVGO': 'XLK',
+    'TSLA': 'XLY', 'BRK-B': 'XLF', 'JPM': 'XLF', 'WMT': 'XLP', 'LLY': 'XLV', 'ORCL': 'XLK', 'V': 'XLF',
+    'NFLX': 'XLC', 'MA': 'XLF', 'XOM': 'XLE', 'COST': 'XLP', 'JNJ': 'XLV', 'PG': 'XLP', 'PLTR': 'XLK',
+    'HD': 'XLY', 'BAC': 'XLF', 'ABBV': 'XLV', 'KO': 'XLP', 'GE': 'XLI', 'PM': 'XLP', 'CSCO': 'XLK',
+    'IBM': 'XLK', 'CVX': 'XLE', 'WFC': 'XLF', 'TMUS': 'XLC', 'UNH': 'XLV', 'AMD': 'XLK', 'CRM': 'XLK',
+    'MS': 'XLF', 'DIS': 'XLC', 'GS': 'XLF', 'AXP': 'XLF', 'ABT': 'XLV', 'MCD': 'XLY', 'INTU': 'XLK',
+    'BX': 'XLF', 'RTX': 'XLI', 'MRK': 'XLV', 'NOW': 'XLK', 'TXN': 'XLK', 'PEP': 'XLP', 'CAT': 'XLI',
+    'T': 'XLC', 'UBER': 'XLI', 'ISRG': 'XLV', 'BKNG': 'XLY', 'SCHW': 'XLF', 'BA': 'XLI', 'VZ': 'XLC',
+    'C': 'XLF', 'BLK': 'XLF', 'QCOM': 'XLK', 'SPGI': 'XLF', 'AMGN': 'XLV', 'GEV': 'XLI', 'TMO': 'XLV',
+    'NEE': 'XLU', 'ADBE': 'XLK', 'BSX': 'XLV', 'AMAT': 'XLK', 'HON': 'XLI', 'SYK': 'XLV', 'PGR': 'XLF',
+    'ANET': 'XLK', 'COF': 'XLF', 'PFE': 'XLV', 'TJX': 'XLY', 'DHR': 'XLV', 'DE': 'XLI', 'KKR': 'XLF',
+    'GILD': 'XLV', 'UNP': 'XLI', 'PANW': 'XLK', 'CMCSA': 'XLC', 'LRCX': 'XLK', 'MU': 'XLK', 'APH': 'XLK',
+    'APP': 'XLK', 'KLAC': 'XLK', 'LOW': 'XLY', 'ADP': 'XLI', 'ADI': 'XLK',
+    # Bond funds move with the bond market, and international funds with ex-US stocks, not the S&P 500.
+    'BND': 'AGG', 'BNDX': 'AGG', 'VCIT': 'AGG', 'SGOV': 'AGG', 'TLT': 'AGG', 'MUB': 'AGG', 'BSV': 'AGG',
+    'VTEB': 'AGG', 'IEF': 'AGG', 'VCSH': 'AGG', 'IUSB': 'AGG', 'JPST': 'AGG', 'VGIT': 'AGG', 'LQD': 'AGG',
+    'GOVT': 'AGG', 'USHY': 'AGG', 'SHY': 'AGG', 'BIV': 'AGG', 'JAAA': 'AGG', 'VGSH': 'AGG', 'IGSB': 'AGG',
+    'MBB': 'AGG', 'BIL': 'AGG',
+    'VEA': 'VXUS', 'IEFA': 'VXUS', 'IEMG': 'VXUS', 'VWO': 'VXUS', 'EFA': 'VXUS', 'SCHF': 'VXUS',
+    'VEU': 'VXUS', 'IXUS': 'VXUS', 'SPDW': 'VXUS', 'VGK': 'VXUS', 'EFV': 'VXUS',
+}
@@ -0,0 +1,115 @@
+import argparse
+import csv
+import json
+import os
+import numpy as np
+from itertools import product
+from multiprocessing import Pool, shared_memory
+from rich import print
+from backtest import DEFAULT_PARAMS, load_fixture, run_backtest
+
+DEFAULT_GRID = {
+    'etf_threshold': [.005, .01, .015, .02],
+    'stock_threshold': [.02, .03, .04, .05],
+    'rapid_growth_multiplier': [1.05, 1.07, 1.1],
+    'slope_months': [12, 24],
+    'require_positive_slope': [True, False],
+}
+METRICS = ['trades', 'pnl', 'mean_return', 'hit_rate', 'max_drawdown']
+
+
+def expand_grid(grid):
+    """
+    Every combination of the grid's values, as a list of parameter dicts.
+    """
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in product(*grid.values())]
+
+
+class SharedArrays:
+    """
+    Copies a fixture's arrays into shared memory once, so pool workers attach to them by name
+    instead of having them pickled into every task.
+    """
+    def __init__(self, data):
+        self.blocks = []
+        self.spec = {}
+        for name, array in data.items():
+            if not isinstance(array, np.ndarray):
+                continue
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    @staticmethod
+    def attach(spec):
+        blocks = {name: shared_memory.SharedMemory(name=block_name) for name, (block_name, _, _) in spec.items()}
+        data = {
+            name: np.ndarray(shape, np.dtype(dtype), buffer=blocks[name].buf)
+            for name, (_, shape, dtype) in spec.items()
+        }
+        return data, blocks
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_worker_data = None
+_worker_blocks = None
+
+
+def _attach_worker(spec):
+    global _worker_data, _worker_blocks
+    # The blocks have to stay referenced for as long as the arrays viewing them are used.
+    _worker_data, _worker_blocks = SharedArrays.attach(spec)
+
+
+def _evaluate(params):
+    return params | run_backtest(_worker_data, params)
+
+
+def sweep(data, grid, processes=None):
+    """
+    Backtests every combination in the grid across all CPU cores. Returns one row per combination, best P&L first.
+    """
+    param_sets = expand_grid(grid)
+    processes = processes or os.cpu_count()
+    with SharedArrays(data) as shared, Pool(processes, initializer=_attach_worker, initargs=(shared.spec,)) as pool:
+        # Tasks sharing a slope window are kept together so each worker reuses its cached slopes.
+        param_sets.sort(key=lambda params: params.get('slope_months', DEFAULT_PARAMS['slope_months']))
+        chunksize = max(1, len(param_sets) // (4 * processes))
+        rows = pool.map(_evaluate, param_sets, chunksize=chunksize)
+    return sorted(rows, key=lambda row: row['pnl'], reverse=True)
+
+
+def save_results(rows, path):
+    fields = list(rows[0].keys()) if rows else METRICS
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep the screening parameters over a local bar fixture.')
+    parser.add_argument('fixture', help='Directory holding the .npy fixture written by backtest.export_fixture.')
+    parser.add_argument('--grid', help='JSON file mapping parameter names to lists of values.')
+    parser.add_argument('--output', default='sweep_results.csv')
+    parser.add_argument('--processes', type=int)
+    args = parser.parse_args()
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid) as file:
+            grid = json.load(file)
+    rows = sweep(load_fixture(args.fixture, mmap=False), grid, args.processes)
+    save_results(rows, args.output)
+    print(f"Wrote {len(rows)} combinations to {args.output}. Best: {rows[0]}")
@@ -1,44 +1,63 @@
-from schwab_client import SchwabClient
+from schwab_client import get_client
+from order_queue import OrderQueue, OrderLedger, SimulatedBroker, print_results
+from metrics import metrics
 import math
-from main import fetch_stock_data
 
-def ensure_sell_limit_orders_for_all():
-    client = SchwabClient()
+def ensure_sell_limit_orders_for_all(queue):
+    client = get_client()
     current_positions = client.view_positions()['securitiesAccount']['positions']
-    open_orders = client.view_open_orders()
-    tickers_with_open_orders = [order['childOrderStrategies'][0]['orderLegCollection'][0]['instrument']['symbol'] for order in open_orders]
-    for current_position in current_positions:
-        if current_position['instrument']['symbol'] in tickers_with_open_orders:
+    order_book = client.sync_orders()
+    unprotected_positions = [
+        current_position for current_position in current_positions
+        if not order_book.has_open_sell_order(current_position['instrument']['symbol'])
+    ]
+    current_prices = client.get_quotes(position['instrument']['symbol'] for position in unprotected_positions)
+    for current_position in unprotected_positions:
+        symbol = current_position['instrument']['symbol']
+        if symbol not in current_prices:
+            print(f"No quote for {symbol}, skipping its sell order.")
             continue
         basis_price = current_position['averagePrice']
-        current_price = fetch_stock_data(current_position['instrument']['symbol'])['current_price']
+        current_price = current_prices[symbol]
         base_price_for_high_selling = max(basis_price, current_price)
         high_price_to_sell = round(base_price_for_high_selling * 1.04, 2)
         qty = math.floor(current_position['longQuantity'])
-        client.place_sell_order(current_position['instrument']['symbol'], qty, high_price_to_sell)
+        queue.add_sell(symbol, qty, high_price_to_sell)
 
-def setup_buy_orders():
+def setup_buy_orders(queue):
     tickers_to_buy = []
 
-    client = SchwabClient()
+    client = get_client()
+    current_prices = client.get_quotes(tickers_to_buy)
     for ticker in tickers_to_buy:
-        limit_price = round(fetch_stock_data(ticker)['current_price'], 2)
+        if ticker not in current_prices:
+            print(f"No quote for {ticker}, skipping its buy order.")
+            continue
+        limit_price = round(current_prices[ticker], 2)
         quantity = 1
-        client.place_buy_order(ticker, quantity, limit_price)
-
-
-def main():
-    ensure_sell_limit_orders_for_all()
-    setup_buy_orders()
+        queue.add_buy(ticker, quantity, limit_price)
+
+
+def main(dry_run=False):
+    """
+    Queues every missing sell order and any buys, then places them in one batch.
+
+    With dry_run, positions, orders and quotes still come from Schwab but the orders go to a SimulatedBroker.
+    """
+    try:
+        if dry_run:
+            queue = OrderQueue(SimulatedBroker(), OrderLedger(':memory:'))
+        else:
+            queue = OrderQueue(get_client())
+        ensure_sell_limit_orders_for_all(queue)
+        setup_buy_orders(queue)
+        print_results(queue.submit())
+    finally:
+        metrics.write_summary('trader')
 
     # client = SchwabClient()
-    # client.place_sell_order('HUYA', 1, 4, 3.6)
     # client.view_positions()
     # client.view_open_orders()
-    # client.place_trade("buy", "IQ", 2, 1.5)
-    # client.place_trade("sell", "IQ", 2, 2.1)
 
 if __name__ == '__main__':
     main()
-
-